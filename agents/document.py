@@ -1,38 +1,63 @@
 import os
 import shutil
-from pdf2image import convert_from_path
 from tqdm import tqdm
 from PIL import Image
-from qdrant_client import models as qdrant_models
 
-from config.settings import PROCESS_IMAGE_OUTPUT_FOLDER, DB_PATH, DB_PATH1, DEFAULT_BATCH_SIZE
-from unstructured.partition.pdf import partition_pdf
+from config.settings import PROCESS_IMAGE_OUTPUT_FOLDER, DB_PATH, DB_PATH1, DEFAULT_BATCH_SIZE, INGEST_PIPELINE_ENABLED, \
+    IMAGE_MAX_BATCH_SIZE, EMBEDDING_CACHE_ENABLED, PAGE_RENDER_DPI, PAGE_PROFILES, IMAGE_POOL_FACTOR, \
+    MAXSIM_INDEX_ENABLED, MULTIVECTOR_NAME
+from models.maxsim_index import MaxSimIndex
+from models.sparse_embedder import sparse_embed_texts
+from models.chunk_store import ChunkStore
+from models.pooling import pool_multivector
+from models.embedding_cache import EmbeddingCache, embed_with_cache, file_content_hash, text_content_hash, \
+    image_content_hash
+from utils.pdf_utils import get_pdf_page_count, iter_pdf_pages, iter_batches
+from utils.pipeline import Pipeline
+from utils.image_utils import select_page_profile, downscale_to_max_pixels
+from utils.image_writer import AsyncImageWriter
+from utils.ingest_manifest import IngestManifest
+import concurrent.futures
+import threading
 import uuid
 from datetime import datetime
 
+# 数据点ID的UUID5命名空间，ID由 (文档哈希, 模态, 序号) 唯一确定
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-8d3b-5e7f-9a0c-1b2d3e4f5a6b")
+
 class Document:
     """表示单个PDF文档的类，包含文档处理的所有相关功能和属性"""
     
-    def __init__(self, pdf_path, text_db,image_db,text_embedder,image_embedder,output_folder=PROCESS_IMAGE_OUTPUT_FOLDER, process_mode="all", image_process_mode="merge"):
+    def __init__(self, pdf_path, text_db,image_db,text_embedder,image_embedder,output_folder=PROCESS_IMAGE_OUTPUT_FOLDER, process_mode="all", image_process_mode="merge", doc_hash=None):
         """
         初始化Document对象
         
         Args:
             pdf_path (str): PDF文件的路径
             output_folder (str): 输出文件夹路径，用于存储转换后的图片
+            doc_hash (str): 已计算好的文档内容哈希，为None时读取文件计算
         """
         self.pdf_path = pdf_path
-        self.doc_id = str(uuid.uuid4())[:8]  # 生成唯一文档ID
+        self.doc_hash = doc_hash or file_content_hash(pdf_path)  # 文档内容哈希
+        self.doc_id = self.doc_hash[:16]  # 由内容决定的文档ID，同一PDF重复入库得到相同ID
         self.filename = os.path.basename(pdf_path)
         
         # 设置图片输出路径
         self.output_folder = os.path.join(output_folder, self.doc_id)
         if not os.path.exists(self.output_folder):
             os.makedirs(self.output_folder)
+
+        # 入库清单，记录已提交的批次，用于中断后续传（首次使用时打开，打开时需要连接数据库）
+        self._manifest = None
+        self._manifest_lock = threading.Lock()
+        self._verified_modalities = set()
             
         # 初始化数据
         self.text_blocks = []  # 存储提取的文本块
+        self.text_pages = []  # 与text_blocks对应的起始页码
+        self._chunk_count = 0  # 由文档库重新打开时记录中的文本块数（不载入原文）
         self.images = []  # 存储转换的图片信息
+        self.page_count = 0  # PDF总页数，渲染前通过pdfinfo获取
         self.created_at = datetime.now().isoformat()
         
         # # 初始化数据库连接
@@ -52,24 +77,134 @@ class Document:
         self.process_mode = process_mode
         self.image_process_mode = image_process_mode
 
+        # 按内容寻址的向量缓存，首次使用时创建（创建时需要读取模型设置）
+        self._text_cache = None
+        self._image_cache = None
+
+        # 各模态的本地MaxSim索引，首次使用时打开
+        self._maxsim_indexes = {}
+
+        # 页面图片在内存中直接交给向量化阶段，写盘由后台线程完成
+        self.image_writer = AsyncImageWriter()
+
+        # 各入库分支的状态（pending/running/done/failed）与已提交条目数
+        self.stage_status = {"text": "pending", "image": "pending"}
+        self.stage_progress = {"text": 0, "image": 0}
+        self.on_stage_change = None  # 回调 (document, stage, status)
+
     
+    @classmethod
+    def from_record(cls, record, text_db, image_db, text_embedder, image_embedder):
+        """由 ChunkStore 中的文档记录重新打开已入库的文档
+
+        直接复用数据库中已有的数据点和文档目录下的页面图片，不重新解析、渲染和向量化，
+        也不读取PDF文件。上次未完成的入库分支视为失败，重新上传同一PDF即可按入库清单续传。
+        """
+        doc = cls(
+            record["pdf_path"], text_db, image_db, text_embedder, image_embedder,
+            output_folder=os.path.dirname(record["output_folder"]),
+            image_process_mode=record["image_process_mode"],
+            doc_hash=record["doc_hash"]
+        )
+        doc.filename = record["filename"]
+        doc.created_at = record["created_at"]
+        doc.page_count = record["page_count"] or 0
+        doc._chunk_count = record["chunk_count"] or 0
+        doc.stage_status = {
+            stage: "done" if record["stage_status"].get(stage) == "done" else "failed"
+            for stage in doc.stage_status
+        }
+        return doc
+
     def document_process(self, mode='all'):
         """处理文档的主函数，包括文本提取和图片转换"""
         try:
             mode = mode or self.process_mode
+            if mode == 'all' and INGEST_PIPELINE_ENABLED:
+                self._run_pipeline()
+                return True
             if mode in ('all', 'text'):
-                self._extract_text()
-                self._process_text_blocks()
+                self._run_stage("text", self._process_text_branch)
             if mode in ('all', 'image'):
-                self._convert_to_images()
-                if self.image_process_mode == "single":
-                    self._process_images()
-                elif self.image_process_mode == "merge":
-                    self._process_images_merged()
+                self._run_stage("image", self._process_image_branch)
             return True
         except Exception as e:
             print(f"处理文档时出错: {str(e)}")
             return False
+
+    def _set_stage(self, stage, status):
+        """更新入库阶段状态，并通知 on_stage_change 回调（如后台任务管理器）"""
+        self.stage_status[stage] = status
+        try:
+            ChunkStore().upsert_document(self)
+        except Exception as e:
+            print(f"保存文档信息时出错: {str(e)}")
+        if self.on_stage_change:
+            try:
+                self.on_stage_change(self, stage, status)
+            except Exception as e:
+                print(f"阶段状态回调出错: {str(e)}")
+
+    def _run_stage(self, stage, func):
+        """执行一个入库分支并维护其状态"""
+        self._set_stage(stage, "running")
+        try:
+            func()
+        except Exception:
+            self._set_stage(stage, "failed")
+            raise
+        self._set_stage(stage, "done")
+
+    @property
+    def chunk_count(self):
+        """文本块总数：入库时为已提取的文本块数，重新打开的文档取文档库记录中的数量"""
+        return len(self.text_blocks) or self._chunk_count
+
+    def stage_total(self, stage):
+        """阶段需要入库的条目总数，尚未知晓时返回None"""
+        if stage == "text":
+            return self.chunk_count if self.stage_status["text"] != "pending" else None
+        if not self.page_count:
+            return None
+        return self.page_count - 1 if self._image_modality() == "merged" else self.page_count
+
+    def searchable_mode(self, mode):
+        """根据各分支完成情况，返回请求的检索模式在当前可用的版本
+
+        文本分支先完成时文档即可以文本模式检索，图片分支仍在后台继续。
+
+        Returns:
+            str: "all"、"text"、"image"，都不可用时返回None
+        """
+        text_ready = self.stage_status["text"] == "done"
+        image_ready = self.stage_status["image"] == "done"
+        if mode == "text":
+            return "text" if text_ready else None
+        if mode == "image":
+            return "image" if image_ready else None
+        if text_ready and image_ready:
+            return mode
+        if text_ready:
+            return "text"
+        if image_ready:
+            return "image"
+        return None
+
+    def _process_text_branch(self):
+        self._extract_text()
+        self._process_text_blocks()
+
+    def _process_image_branch(self):
+        # 页面边渲染边保存边编码，不再等待整本PDF转换完成
+        pages = self._iter_pages()
+        if self.image_process_mode == "single":
+            self._process_images(pages)
+        elif self.image_process_mode == "merge":
+            self._process_images_merged(pages)
+        else:
+            self._convert_to_images()
+        # 确保所有页面图片已写盘，后续检索与VLM读取依赖这些文件
+        self.image_writer.flush()
     
     # def document_process(self, mode='all'):
     #     """处理文档的主函数，包括文本提取和图片转换"""
@@ -87,6 +222,8 @@ class Document:
 
     def _extract_text(self):
         """从PDF中提取文本内容"""
+        # unstructured导入较慢，只在真正解析时导入
+        from unstructured.partition.pdf import partition_pdf
         try:
             print(f"正在从 {self.filename} 提取文本...")
             raw_pdf_elements = partition_pdf(
@@ -102,36 +239,249 @@ class Document:
             for element in raw_pdf_elements:
                 if "unstructured.documents.elements.CompositeElement" in str(type(element)):
                     self.text_blocks.append(element.text)
+                    self.text_pages.append(getattr(element.metadata, "page_number", None))
             
             print(f"成功提取 {len(self.text_blocks)} 个文本块")
             
         except Exception as e:
             print(f"提取文本时出错: {str(e)}")
 
-    def _convert_to_images(self):
-        """将PDF转换为图片"""
+    def _iter_pages(self):
+        """流式渲染PDF页面，每渲染完一页立即保存并产出其页面信息
+
+        页面按 PDF_PAGE_WINDOW 大小的窗口渲染，下游在消费当前页时，
+        后续页面尚未渲染，因此峰值内存与总页数无关。
+        """
         try:
-            images = convert_from_path(self.pdf_path)
-            print(f"正在处理: {self.filename}, 共 {len(images)} 页")
-            
-            for page_num, image in enumerate(images):
-                image_path = os.path.join(
-                    self.output_folder,
-                    f'page_{page_num + 1}.png'
+            self.page_count = get_pdf_page_count(self.pdf_path)
+            print(f"正在处理: {self.filename}, 共 {self.page_count} 页")
+
+            for page_num, image in iter_pdf_pages(self.pdf_path, page_count=self.page_count, dpi=PAGE_RENDER_DPI):
+                # 按页面内容选择格式、质量与像素上限
+                profile_name, profile = select_page_profile(image)
+                page_image = downscale_to_max_pixels(image, profile["max_pixels"])
+                if page_image is not image:
+                    image.close()
+                image_path = self.image_writer.submit(
+                    page_image, os.path.join(self.output_folder, f'page_{page_num}'), profile
                 )
-                image.save(image_path, 'PNG')
-                
-                self.images.append({
+
+                # 'image' 只在入库过程中暂存，向量化后即释放
+                page_info = {
                     'pdf_filename': self.filename,
-                    'page_num': page_num + 1,
-                    'image_path': image_path
-                })
-            
+                    'page_num': page_num,
+                    'image_path': image_path,
+                    'profile': profile_name,
+                    'image': page_image
+                }
+                self.images.append(page_info)
+                yield page_info
+
             print(f"完成PDF转换，共处理 {len(self.images)} 页")
-            
+
         except Exception as e:
             print(f"转换图片时出错: {str(e)}")
 
+    def _convert_to_images(self):
+        """将PDF转换为图片（仅渲染保存，不生成向量）"""
+        for page in self._iter_pages():
+            page.pop('image', None)
+        self.image_writer.flush()
+
+    @staticmethod
+    def _load_page_image(item):
+        """优先使用内存中的页面图片，不存在时（如跨进程传递的页面）从磁盘读取"""
+        image = item.get('image')
+        return image if image is not None else Image.open(item['image_path'])
+
+    def _get_text_cache(self):
+        if EMBEDDING_CACHE_ENABLED and self._text_cache is None:
+            self._text_cache = EmbeddingCache(self.text_embedder.cache_namespace())
+        return self._text_cache
+
+    def _get_image_cache(self):
+        if EMBEDDING_CACHE_ENABLED and self._image_cache is None:
+            self._image_cache = EmbeddingCache(self.image_embedder.cache_namespace())
+        return self._image_cache
+
+    def point_id(self, modality, index):
+        """由 (文档哈希, 模态, 序号) 生成全局唯一且确定的数据点ID
+
+        Args:
+            modality: "text"、"image" 或 "merged"
+            index: 文本块序号或页面序号
+        """
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{self.doc_hash}:{modality}:{index}"))
+
+    def _image_modality(self):
+        return "merged" if self.image_process_mode == "merge" else "image"
+
+    def _db_for(self, modality):
+        return self.text_db if modality == "text" else self.image_db
+
+    @property
+    def manifest(self):
+        """入库清单，绑定到文本库与图片库的写入位置，换库（模式、布局或集合变化）后旧清单作废"""
+        if self._manifest is None:
+            with self._manifest_lock:
+                if self._manifest is None:
+                    self._manifest = IngestManifest(
+                        os.path.join(self.output_folder, "ingest_manifest.json"), self.doc_hash,
+                        target={"text": self.text_db.storage_key(), "image": self.image_db.storage_key()}
+                    )
+        return self._manifest
+
+    def _verify_manifest(self, modality):
+        """首次使用某模态的清单时核对库中的数据点数
+
+        数据点少于清单记录的条目数（集合被清空、内存模式重启等）时作废该模态的记录，
+        已写入的数据点ID是确定的，重新写入只会覆盖。
+        """
+        with self._manifest_lock:
+            if modality in self._verified_modalities:
+                return
+            self._verified_modalities.add(modality)
+        done = self.manifest.done_count(modality)
+        if not done:
+            return
+        count = self._db_for(modality).count_points(self.doc_id, None if modality == "text" else modality)
+        if count < done:
+            print(f"入库清单记录 {modality} 已完成 {done} 条，但库中只有 {count} 条，将重新入库")
+            self.manifest.reset(modality)
+
+    def _pending(self, modality, indexed_batch):
+        """过滤掉入库清单中已提交的条目"""
+        self._verify_manifest(modality)
+        return [(i, item) for i, item in indexed_batch if not self.manifest.is_done(modality, i)]
+
+    def _report_resume(self, modality):
+        self._verify_manifest(modality)
+        done = self.manifest.done_count(modality)
+        if done:
+            print(f"检测到入库清单，{modality} 已完成 {done} 条，跳过已提交的批次继续处理")
+
+    def maxsim_index(self, modality):
+        """文档目录下该模态（text/image/merged）的本地MaxSim索引"""
+        if modality not in self._maxsim_indexes:
+            self._maxsim_indexes[modality] = MaxSimIndex(os.path.join(self.output_folder, "maxsim"), modality)
+        return self._maxsim_indexes[modality]
+
+    def _store_entries(self, modality, indexed_batch, points):
+        """已写库数据点对应的文本块/页面条目，写入 ChunkStore"""
+        items = {self.point_id(modality, i): (i, item) for i, item in indexed_batch}
+        entries = []
+        for point in points:
+            index, item = items[point.id]
+            entry = {"point_id": point.id, "doc_id": self.doc_id, "modality": modality, "idx": index,
+                     "page_num": point.payload.get("page_num")}
+            if modality == "text":
+                entry["text"] = item
+            else:
+                entry["image_path"] = item["image_path"]
+                entry["pdf_filename"] = item["pdf_filename"]
+            entries.append(entry)
+        return entries
+
+    def _commit_points(self, db, modality, indexed_batch, points):
+        """写入数据库，成功后写入文本块存储和本地MaxSim索引，并在入库清单中记录该批次"""
+        if points and not db.save_points(points):
+            return False
+        if points:
+            ChunkStore().add_entries(self._store_entries(modality, indexed_batch, points))
+        if points and MAXSIM_INDEX_ENABLED:
+            self.maxsim_index(modality).add(
+                [point.id for point in points],
+                [point.vector[MULTIVECTOR_NAME] if isinstance(point.vector, dict) else point.vector
+                 for point in points],
+                [point.payload for point in points],
+            )
+        self.manifest.mark_done(modality, [i for i, _ in indexed_batch])
+        self.stage_progress["text" if modality == "text" else "image"] += len(indexed_batch)
+        return True
+
+    def _make_text_point(self, index, embedding, sparse_vector=None):
+        """由文本块序号、多向量和BM25稀疏向量构造数据点"""
+        return self.text_db.make_point(
+            self.point_id("text", index),
+            embedding,
+            payload={
+                "doc_id": self.doc_id,
+                "chunk_index": index,
+                "page_num": self.text_pages[index] if index < len(self.text_pages) else None,
+                "created_at": self.created_at
+            },
+            sparse_vector=sparse_vector,
+        )
+
+    def _make_image_point(self, modality, index, item, embedding):
+        """由页面序号、页面信息和多向量构造数据点
+
+        入库前按 IMAGE_POOL_FACTOR 池化patch向量（缓存中保存的始终是未池化的向量）
+        """
+        return self.image_db.make_point(
+            self.point_id(modality, index),
+            pool_multivector(embedding, IMAGE_POOL_FACTOR),
+            payload={
+                "pool_factor": IMAGE_POOL_FACTOR,
+                "doc_id": self.doc_id,
+                "modality": modality,
+                "pdf_filename": item["pdf_filename"],
+                "page_num": item["page_num"],
+                "image_path": item["image_path"],
+                "created_at": self.created_at
+            },
+        )
+
+    def _build_text_points(self, indexed_batch):
+        """为一批 (序号, 文本块) 生成向量并构造数据点，已缓存的文本块不再经过模型"""
+        indexed_batch = self._pending("text", indexed_batch)
+        if not indexed_batch:
+            return []
+        batch = [text for _, text in indexed_batch]
+        text_embeddings = embed_with_cache(
+            self._get_text_cache(),
+            [text_content_hash(text) for text in batch],
+            batch,
+            self.text_embedder.get_text_embeddings
+        )
+
+        sparse_vectors = sparse_embed_texts(batch)
+
+        return [self._make_text_point(i, embedding, sparse_vector)
+                for (i, _), embedding, sparse_vector in zip(indexed_batch, text_embeddings, sparse_vectors)]
+
+    def _build_image_points(self, indexed_batch, modality):
+        """为一批 (序号, 页面信息) 生成图片向量并构造数据点，已缓存的页面不再经过模型"""
+        pending = self._pending(modality, indexed_batch)
+        if len(pending) < len(indexed_batch):
+            # 已提交的页面不再向量化，直接释放其内存图片
+            pending_indices = {i for i, _ in pending}
+            for i, item in indexed_batch:
+                if i not in pending_indices:
+                    item.pop('image', None)
+        indexed_batch = pending
+        if not indexed_batch:
+            return []
+        batch = [item for _, item in indexed_batch]
+        # 直接使用渲染阶段交来的内存图片，不再读回磁盘文件
+        images = [self._load_page_image(item) for item in batch]
+
+        try:
+            # 按token预算动态分批生成向量
+            image_embeddings = embed_with_cache(
+                self._get_image_cache(),
+                [image_content_hash(image) for image in images],
+                images,
+                self.image_embedder.embed_images
+            )
+        finally:
+            # 向量化后释放内存中的图片，文件由后台写盘线程负责
+            for item in batch:
+                item.pop('image', None)
+
+        return [self._make_image_point(modality, i, item, embedding)
+                for (i, item), embedding in zip(indexed_batch, image_embeddings)]
+
     def _process_text_blocks(self):
         """处理文本块并保存到文本数据库"""
         if not self.text_blocks:
@@ -139,136 +489,195 @@ class Document:
             return
             
         print("\n开始生成文本向量并保存到文本数据库...")
+        self._report_resume("text")
         
         with tqdm(total=len(self.text_blocks), desc="处理进度") as pbar:
-            for i in range(0, len(self.text_blocks), DEFAULT_BATCH_SIZE):
-                batch = self.text_blocks[i : i + DEFAULT_BATCH_SIZE]
-
+            for batch in iter_batches(enumerate(self.text_blocks), DEFAULT_BATCH_SIZE):
                 try:
-                    text_embeddings = self.text_embedder.get_text_embeddings(batch)
-
-                    points = []
-                    for j, embedding in enumerate(text_embeddings):
-                        points.append(
-                            qdrant_models.PointStruct(
-                                id=i+j,
-                                vector=embedding.tolist(),
-                                payload={
-                                    "doc_id": self.doc_id,
-                                    "created_at": self.created_at
-                                },
-                            )
-                        )
-                    
-                    if self.text_db.save_points(points):
+                    points = self._build_text_points(batch)
+                    if self._commit_points(self.text_db, "text", batch, points):
                         pbar.update(len(batch))
 
                 except Exception as e:
-                    print(f"\n处理批次 {i//DEFAULT_BATCH_SIZE + 1} 时出错: {str(e)}")
+                    print(f"\n处理批次 {batch[0][0]//DEFAULT_BATCH_SIZE + 1} 时出错: {str(e)}")
                     continue
         
         print("\n✅ 所有文字部分已保存到数据库")
 
-    def _process_images(self):
-        """处理图片并保存到图片数据库"""
-        if not self.images:
-            print("没有图片需要处理")
-            return
+    def _process_images(self, pages=None):
+        """处理图片并保存到图片数据库
+
+        Args:
+            pages: 页面信息的可迭代对象，可以是 _iter_pages() 产生的流，
+                为None时处理已转换好的 self.images
+        """
+        if pages is None:
+            if not self.images:
+                print("没有图片需要处理")
+                return
+            pages, total = self.images, len(self.images)
+        else:
+            total = self.page_count or None
 
         print("\n开始生成图片向量并保存到图片数据库...")
-        
-        with tqdm(total=len(self.images), desc="处理进度") as pbar:
-            for i in range(0, len(self.images), DEFAULT_BATCH_SIZE):
-                batch = self.images[i : i + DEFAULT_BATCH_SIZE]
-                
+        self._report_resume("image")
+
+        processed = 0
+        with tqdm(total=total, desc="处理进度") as pbar:
+            for batch in iter_batches(enumerate(pages), IMAGE_MAX_BATCH_SIZE):
+                processed += len(batch)
                 try:
-                    # 读取图片
-                    images = [Image.open(item['image_path']) for item in batch]
-                    
-                    # 生成向量
-                    image_embeddings = self.image_embedder.get_image_embeddings(images)
-                    
-                    points = []
-                    for j, embedding in enumerate(image_embeddings):
-                        points.append(
-                            qdrant_models.PointStruct(
-                                id=i+j,
-                                vector=embedding.tolist(),
-                                payload={
-                                    "doc_id": self.doc_id,
-                                    "pdf_filename": batch[j]["pdf_filename"],
-                                    "page_num": batch[j]["page_num"],
-                                    "image_path": batch[j]["image_path"],
-                                    "created_at": self.created_at
-                                },
-                            )
-                        )
-                    
-                    if self.image_db.save_points(points):
+                    points = self._build_image_points(batch, "image")
+                    if self._commit_points(self.image_db, "image", batch, points):
                         pbar.update(len(batch))
                     
                 except Exception as e:
-                    print(f"\n处理批次 {i//DEFAULT_BATCH_SIZE + 1} 时出错: {str(e)}")
+                    print(f"\n处理批次 {batch[0][0]//IMAGE_MAX_BATCH_SIZE + 1} 时出错: {str(e)}")
                     continue
 
+        if not processed:
+            print("没有图片需要处理")
+            return
+
         print("\n✅ 所有图片已保存到数据库")
 
-    def _process_images_merged(self):
-        """将相邻两张图片拼接后生成embedding并保存到图片数据库"""
-        if not self.images or len(self.images) < 2:
-            print("没有足够的图片进行拼接处理")
-            return
+    def _iter_merged_pages(self, pages):
+        """将相邻两页竖直拼接，逐对产出拼接图片信息（只保留上一页的引用）"""
+        prev = None
+        for page in pages:
+            if prev is not None:
+                im1 = self._load_page_image(prev)
+                im2 = self._load_page_image(page)
+                # 竖直拼接
+                dst = Image.new('RGB', (max(im1.width, im2.width), im1.height + im2.height), 'white')
+                dst.paste(im1, (0, 0))
+                dst.paste(im2, (0, im1.height))
+                # 任一页为文字页时按文字页策略编码；拼接后像素约为单页的两倍，同样按策略的像素上限缩小
+                profile_name = "text" if "text" in (prev.get('profile'), page.get('profile')) else "figure"
+                profile = PAGE_PROFILES[profile_name]
+                dst = downscale_to_max_pixels(dst, profile["max_pixels"])
+                merged_path = self.image_writer.submit(
+                    dst, os.path.join(self.output_folder, f"merged_{prev['page_num']}_{page['page_num']}"), profile
+                )
+                # 上一页已不再需要，释放其内存图片
+                prev.pop('image', None)
+                yield {
+                    'pdf_filename': self.filename,
+                    'page_num': f"{prev['page_num']}_{page['page_num']}",
+                    'image_path': merged_path,
+                    'image': dst
+                }
+            prev = page
+        if prev is not None:
+            prev.pop('image', None)
+
+    def _process_images_merged(self, pages=None):
+        """将相邻两张图片拼接后生成embedding并保存到图片数据库
+
+        Args:
+            pages: 页面信息的可迭代对象，可以是 _iter_pages() 产生的流，
+                为None时处理已转换好的 self.images
+        """
+        if pages is None:
+            if len(self.images) < 2:
+                print("没有足够的图片进行拼接处理")
+                return
+            pages, total = self.images, len(self.images) - 1
+        else:
+            total = max(self.page_count - 1, 0) or None
 
         print("\n开始拼接图片并生成图片向量保存到图片数据库...")
+        self._report_resume("merged")
 
-        merged_image_infos = []
-        for i in range(len(self.images) - 1):
-            img1_path = self.images[i]['image_path']
-            img2_path = self.images[i+1]['image_path']
-            im1 = Image.open(img1_path)
-            im2 = Image.open(img2_path)
-            # 竖直拼接
-            dst = Image.new('RGB', (im1.width, im1.height + im2.height))
-            dst.paste(im1, (0, 0))
-            dst.paste(im2, (0, im1.height))
-            merged_path = os.path.join(self.output_folder, f'merged_{i+1}_{i+2}.png')
-            dst.save(merged_path)
-            merged_image_infos.append({
-                'pdf_filename': self.filename,
-                'page_num': f"{self.images[i]['page_num']}_{self.images[i+1]['page_num']}",
-                'image_path': merged_path
-            })
-
-        # 批量处理拼接图片
-        with tqdm(total=len(merged_image_infos), desc="拼接图片处理进度") as pbar:
-            for i in range(0, len(merged_image_infos), DEFAULT_BATCH_SIZE):
-                batch = merged_image_infos[i : i + DEFAULT_BATCH_SIZE]
+        processed = 0
+        with tqdm(total=total, desc="拼接图片处理进度") as pbar:
+            for batch in iter_batches(enumerate(self._iter_merged_pages(pages)), IMAGE_MAX_BATCH_SIZE):
+                processed += len(batch)
                 try:
-                    images = [Image.open(item['image_path']) for item in batch]
-                    image_embeddings = self.image_embedder.get_image_embeddings(images)
-                    points = []
-                    for j, embedding in enumerate(image_embeddings):
-                        points.append(
-                            qdrant_models.PointStruct(
-                                id=i+j,
-                                vector=embedding.tolist(),
-                                payload={
-                                    "doc_id": self.doc_id,
-                                    "pdf_filename": batch[j]["pdf_filename"],
-                                    "page_num": batch[j]["page_num"],
-                                    "image_path": batch[j]["image_path"],
-                                    "created_at": self.created_at
-                                },
-                            )
-                        )
-                    if self.image_db.save_points(points):
+                    points = self._build_image_points(batch, "merged")
+                    if self._commit_points(self.image_db, "merged", batch, points):
                         pbar.update(len(batch))
                 except Exception as e:
-                    print(f"\n处理拼接图片批次 {i//DEFAULT_BATCH_SIZE + 1} 时出错: {str(e)}")
+                    print(f"\n处理拼接图片批次 {batch[0][0]//IMAGE_MAX_BATCH_SIZE + 1} 时出错: {str(e)}")
                     continue
 
+        if not processed:
+            print("没有足够的图片进行拼接处理")
+            return
+
         print("\n✅ 所有拼接图片已保存到数据库")
 
+    def _iter_text_blocks(self):
+        """提取文本并逐个产出 (序号, 文本块)，作为文本流水线的数据源"""
+        self._extract_text()
+        yield from enumerate(self.text_blocks)
+
+    def _make_embed_stage(self, build_points, desc):
+        """构造流水线的向量化阶段：单批出错时打印并跳过，与顺序处理的行为一致"""
+        def embed(batch):
+            try:
+                return [(batch, build_points(batch))]
+            except Exception as e:
+                print(f"\n处理{desc}批次(起始序号 {batch[0][0]}) 时出错: {str(e)}")
+                return None
+        return embed
+
+    def _make_upsert_stage(self, db, modality, pbar):
+        """构造流水线的入库阶段，批次写入成功后记入入库清单"""
+        def upsert(item):
+            batch, points = item
+            if self._commit_points(db, modality, batch, points):
+                pbar.update(len(batch))
+        return upsert
+
+    def _run_text_pipeline(self):
+        """文本分支：版面解析 -> ColBERT向量化 -> 入库"""
+        self._report_resume("text")
+        with tqdm(desc="文本处理进度") as pbar:
+            Pipeline("text", self._iter_text_blocks()) \
+                .add_stage("embed", self._make_embed_stage(self._build_text_points, "文本"),
+                           batch_size=DEFAULT_BATCH_SIZE) \
+                .add_stage("upsert", self._make_upsert_stage(self.text_db, "text", pbar)) \
+                .run()
+        print("\n✅ 所有文字部分已保存到数据库")
+
+    def _run_image_pipeline(self):
+        """图片分支：渲染保存 -> (相邻页拼接) -> ColQwen2向量化 -> 入库"""
+        pages = self._iter_pages()
+        if self.image_process_mode == "merge":
+            pages = self._iter_merged_pages(pages)
+        elif self.image_process_mode != "single":
+            self._convert_to_images()
+            return
+
+        modality = self._image_modality()
+        self._report_resume(modality)
+        with tqdm(desc="图片处理进度") as pbar:
+            Pipeline("image", enumerate(pages)) \
+                .add_stage("embed", self._make_embed_stage(
+                               lambda batch: self._build_image_points(batch, modality), "图片"),
+                           batch_size=IMAGE_MAX_BATCH_SIZE) \
+                .add_stage("upsert", self._make_upsert_stage(self.image_db, modality, pbar)) \
+                .run()
+        # 确保所有页面图片已写盘，后续检索与VLM读取依赖这些文件
+        self.image_writer.flush()
+        print("\n✅ 所有图片已保存到数据库")
+
+    def _run_pipeline(self):
+        """文本与图片两条流水线并发执行
+
+        CPU密集的版面解析/PDF渲染与模型推理相互重叠，
+        上传到可检索的总耗时趋近于最慢的阶段，而非各阶段之和。
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest") as executor:
+            futures = [
+                executor.submit(self._run_stage, "text", self._run_text_pipeline),
+                executor.submit(self._run_stage, "image", self._run_image_pipeline),
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                # 任一分支出错时抛出，由 document_process 统一处理
+                future.result()
+
     def delete(self):
         """删除文档相关的所有资源"""
         try:
@@ -277,11 +686,14 @@ class Document:
                 shutil.rmtree(self.output_folder)
                 print(f"已删除图片文件夹: {self.output_folder}")
             
-            # 2. 从文本数据库中删除记录
+            # 2. 删除文本块存储中的记录
+            ChunkStore().delete_document(self.doc_id)
+
+            # 3. 从文本数据库中删除记录
             self.text_db.delete_by_filter(self.doc_id,"text_collection")
             print("已从文本数据库删除记录")
             
-            # 3. 从图片数据库中删除记录
+            # 4. 从图片数据库中删除记录
             self.image_db.delete_by_filter(self.doc_id,"image_collection")
             print("已从图片数据库删除记录")
             
@@ -1,18 +1,133 @@
 import os
-from pdf2image import convert_from_path
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+import concurrent.futures
 from tqdm import tqdm
 from PIL import Image
-from qdrant_client import models as qdrant_models
 from models.embedder import ColQwen2Embedder, ColBertEmbedder
 from models.database import QdrantManager
-from config.settings import PDF_FOLDER, OUTPUT_FOLDER, DB_PATH, DB_PATH1,DB_NAME, DEFAULT_BATCH_SIZE
+from models.sparse_embedder import sparse_embed_texts
+from models.embedding_cache import EmbeddingCache, embed_with_cache, text_content_hash, image_content_hash, \
+    file_content_hash
+from models.chunk_store import ChunkStore
+from config.settings import PDF_FOLDER, PROCESS_IMAGE_OUTPUT_FOLDER, DB_PATH, DB_PATH1,DB_NAME, \
+    EMBEDDING_CACHE_ENABLED, IMAGE_MAX_BATCH_SIZE, INGEST_WORKERS, INGEST_TEXT_BATCH_SIZE, PAGE_RENDER_DPI
 from unstructured.partition.pdf import partition_pdf
-import uuid
-from datetime import datetime
+from agents.document import Document
+from agents.ingest_worker import prepare_document
+from utils.pdf_utils import iter_pdf_pages
+from utils.image_utils import select_page_profile, downscale_to_max_pixels, save_page_image
+from utils.pipeline import Pipeline
+
+
+class _IngestProgress:
+    """批量入库的进度与吞吐统计（文本、图片两个入库线程共同更新）
+
+    每个文件的待入库条目全部提交后，把文档各分支标记为完成并登记到 ChunkStore 文档库。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self.files = {}
+        self.finished_files = 0
+        self.failed_files = 0
+        self.skipped_files = 0
+        self.total_items = 0
+
+    def add_file(self, doc, prepared, pending):
+        with self._lock:
+            self.files[doc.doc_id] = {
+                "doc": doc,
+                "filename": doc.filename,
+                "pending": pending,
+                "failed_stages": set(),
+                "page_count": prepared["page_count"],
+                "chunk_count": len(prepared["text_blocks"]),
+                "prepare_time": prepared["text_time"] + prepared["image_time"],
+                "queued_at": time.time(),
+            }
+            if not pending:
+                self._finish(doc.doc_id)
+
+    def skip_file(self, filename):
+        with self._lock:
+            self.skipped_files += 1
+        tqdm.write(f"⏭️ {filename}: 文档库中已完成入库，跳过解析与渲染")
+
+    def fail_file(self, filename, e):
+        with self._lock:
+            self.failed_files += 1
+        print(f"❌ 处理文件 {filename} 时出错: {str(e)}")
+
+    def update(self, doc, count):
+        with self._lock:
+            self.total_items += count
+            info = self.files[doc.doc_id]
+            info["pending"] -= count
+            if info["pending"] <= 0:
+                self._finish(doc.doc_id)
+
+    def fail(self, doc, modality, count):
+        """记录写库失败的条目：计入待处理数的扣减，文件完成时对应分支标记为失败"""
+        with self._lock:
+            info = self.files[doc.doc_id]
+            info["failed_stages"].add("text" if modality == "text" else "image")
+            info["pending"] -= count
+            if info["pending"] <= 0:
+                self._finish(doc.doc_id)
+
+    def abort_pending(self):
+        """模型线程异常退出后，仍有未提交条目的文件全部标记为失败"""
+        with self._lock:
+            for doc_id, info in self.files.items():
+                if info["pending"] > 0:
+                    info["pending"] = 0
+                    info["failed_stages"].update(("text", "image"))
+                    self._finish(doc_id)
+
+    def _finish(self, doc_id):
+        info = self.files[doc_id]
+        for stage in ("text", "image"):
+            info["doc"]._set_stage(stage, "failed" if stage in info["failed_stages"] else "done")
+        if info["failed_stages"]:
+            self.failed_files += 1
+            tqdm.write(f"❌ {info['filename']}: 部分条目入库失败，重新运行可续传未完成的条目")
+            return
+        self.finished_files += 1
+        embed_time = time.time() - info["queued_at"]
+        tqdm.write(
+            f"✅ [{self.finished_files}] {info['filename']}: {info['page_count']} 页, "
+            f"{info['chunk_count']} 个文本块, 解析渲染 {info['prepare_time']:.1f}s, "
+            f"向量化入库 {embed_time:.1f}s"
+        )
+
+    def summary(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        pages = sum(info["page_count"] for info in self.files.values())
+        print(
+            f"\n批量入库完成: 成功 {self.finished_files} 个文件, 失败 {self.failed_files} 个, "
+            f"已入库跳过 {self.skipped_files} 个, "
+            f"共 {pages} 页, 用时 {elapsed:.1f}s, "
+            f"吞吐 {self.finished_files / elapsed * 60:.1f} 文件/分钟, {pages / elapsed:.2f} 页/秒"
+        )
+
+
+def _iter_queue(q):
+    """将队列转为生成器，遇到None结束"""
+    while True:
+        item = q.get()
+        if item is None:
+            return
+        yield item
+
 
 class DocumentProcessor:
     """文档处理类，支持PDF转图片和OCR文本提取"""
-    def __init__(self, pdf_folder=PDF_FOLDER, output_folder=OUTPUT_FOLDER):
+    def __init__(self, pdf_folder=PDF_FOLDER, output_folder=PROCESS_IMAGE_OUTPUT_FOLDER):
         self.pdf_folder = pdf_folder
         self.output_folder = output_folder
         # 初始化两个embedder
@@ -48,16 +163,20 @@ class DocumentProcessor:
         for filename in tqdm(pdf_files, desc="处理PDF文件"):
             pdf_path = os.path.join(self.pdf_folder, filename)
             try:
-                images = convert_from_path(pdf_path)
-                print(f"正在处理: {filename}, 共 {len(images)} 页")
-                
-                for page_num, image in enumerate(images):
-                    image_path = os.path.join(self.output_folder, f'{filename}_page_{page_num + 1}.png')
-                    image.save(image_path, 'PNG')
+                print(f"正在处理: {filename}")
+
+                # 按窗口流式渲染，每页保存后立即释放
+                for page_num, image in iter_pdf_pages(pdf_path, dpi=PAGE_RENDER_DPI):
+                    _, profile = select_page_profile(image)
+                    image_path = save_page_image(
+                        downscale_to_max_pixels(image, profile["max_pixels"]),
+                        os.path.join(self.output_folder, f'{filename}_page_{page_num}'), profile
+                    )
+                    image.close()
                     
                     all_images.append({
                         'pdf_filename': filename,
-                        'page_num': page_num + 1,
+                        'page_num': page_num,
                         'image_path': image_path
                     })
                     
@@ -109,146 +228,191 @@ class DocumentProcessor:
             print(f"提取文本时出错: {str(e)}")
             return []
 
-    def generate_document_id(self,):
-        """为文档生成唯一ID
-        
-        Args:
+    def _embed_texts(self, batch):
+        """模型阶段：合并来自多个文档的文本块，一次ColBERT前向传播"""
+        texts = [text for _, _, _, text in batch]
+        embeddings = embed_with_cache(
+            self.text_cache, [text_content_hash(text) for text in texts],
+            texts, self.text_embedder.get_text_embeddings
+        )
+        sparse_vectors = sparse_embed_texts(texts)
+        return [(batch, [doc._make_text_point(i, embedding, sparse_vector)
+                         for (doc, _, i, _), embedding, sparse_vector in zip(batch, embeddings, sparse_vectors)])]
 
-        Returns:
-            str: 唯一文档ID
-        """
-        # 使用UUID和时间戳生成唯一ID
-        # timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # unique_id = str(uuid.uuid4())[:8]
-        # return f"doc_{timestamp}_{unique_id}"
-
-        return str(uuid.uuid4())[:8]
-    
-    def process_text_blocks(self, text_blocks, doc_id):
-        """处理文本块并保存到文本数据库"""
-        if not text_blocks:
-            print("没有文本需要处理")
-            return
-            
-        print("\n开始生成文本向量并保存到文本数据库...")
-        
-        #生成文本向量
-        with tqdm(total=len(text_blocks), desc="处理进度") as pbar:
-            for i in range(0, len(text_blocks), DEFAULT_BATCH_SIZE):
-                batch = text_blocks[i : i + DEFAULT_BATCH_SIZE]
+    def _embed_images(self, batch):
+        """模型阶段：合并来自多个文档的页面，按token预算动态分批编码"""
+        images = [Image.open(item["image_path"]) for _, _, _, item in batch]
+        embeddings = embed_with_cache(
+            self.image_cache, [image_content_hash(image) for image in images],
+            images, self.image_embedder.embed_images
+        )
+        return [(batch, [doc._make_image_point(modality, i, item, embedding)
+                         for (doc, modality, i, item), embedding in zip(batch, embeddings)])]
 
-                try:
-                    text_embeddings = self.text_embedder.get_text_embeddings(batch)
-
-                    # 保存到文本数据库
-                    points = []
-                    for j, embedding in enumerate(text_embeddings):
-                        points.append(
-                            qdrant_models.PointStruct(
-                                id=i+j,
-                                vector=embedding.tolist(),
-                                payload={
-                                    "doc_id": doc_id,
-                                    # "pdf_filename": batch[j]["pdf_filename"],
-                                    "created_at": datetime.now().isoformat()
-                                },
-                            )
-                        )
-                    # 保存到文本数据库
-                    if self.text_db.save_points(points):
-                        pbar.update(DEFAULT_BATCH_SIZE)
-
-                except Exception as e:
-                    print(f"\n处理批次 {i//DEFAULT_BATCH_SIZE + 1} 时出错: {str(e)}")
-                    continue
-        print("\n✅ 所有文字部分已保存到数据库")
-            
-                    
+    def _make_embed_stage(self, embed, desc, progress):
+        """构造模型阶段：批次出错（如页面图片缺失或损坏）时只丢弃该批次，并把涉及的文件记为失败"""
+        def stage(batch):
+            try:
+                return embed(batch)
+            except Exception as e:
+                print(f"\n{desc}批次向量化出错: {str(e)}")
+                groups = {}
+                for doc, modality, _, _ in batch:
+                    groups.setdefault((doc.doc_id, modality), [doc, modality, 0])[2] += 1
+                for doc, modality, count in groups.values():
+                    progress.fail(doc, modality, count)
+                return None
+        return stage
 
-    def process_images(self, all_images, doc_id):
-        """处理图片并保存到图片数据库"""
-        if not all_images:
-            print("没有图片需要处理")
-            return
+    def _make_commit_stage(self, db, progress, pbar):
+        """入库阶段：按文档拆分批次，分别写库并记入各自的入库清单"""
+        def commit(item):
+            batch, points = item
+            groups = {}
+            for entry, point in zip(batch, points):
+                doc, modality, i, payload = entry
+                group = groups.setdefault((doc.doc_id, modality), (doc, [], []))
+                group[1].append((i, payload))
+                group[2].append(point)
+            for (_, modality), (doc, indexed_batch, doc_points) in groups.items():
+                if doc._commit_points(db, modality, indexed_batch, doc_points):
+                    progress.update(doc, len(indexed_batch))
+                    pbar.update(len(indexed_batch))
+                else:
+                    progress.fail(doc, modality, len(indexed_batch))
+        return commit
 
-        print("\n开始生成图片向量并保存到图片数据库...")
-        
-        with tqdm(total=len(all_images), desc="处理进度") as pbar:
-            for i in range(0, len(all_images), DEFAULT_BATCH_SIZE):
-                batch = all_images[i : i + DEFAULT_BATCH_SIZE]
-                
-                try:
-                    # 读取图片
-                    images = [Image.open(item['image_path']) for item in batch]
-                    
-                    # 生成向量
-                    image_embeddings = self.image_embedder.get_image_embeddings(images)
-                    
-                    # 准备数据点
-                    points = []
-                    for j, embedding in enumerate(image_embeddings):
-                        points.append(
-                            qdrant_models.PointStruct(
-                                id=i+j,
-                                vector=embedding.tolist(),
-                                payload={
-                                    "doc_id": doc_id,
-                                    "pdf_filename": batch[j]["pdf_filename"],
-                                    "page_num": batch[j]["page_num"],
-                                    "image_path": batch[j]["image_path"],
-                                    "created_at": datetime.now().isoformat()
-                                },
-                            )
-                        )
-                    
-                    # 保存到图片数据库
-                    if self.image_db.save_points(points):
-                        pbar.update(DEFAULT_BATCH_SIZE)
-                    
-                except Exception as e:
-                    print(f"\n处理批次 {i//DEFAULT_BATCH_SIZE + 1} 时出错: {str(e)}")
-                    continue
+    def process_documents(self, workers=INGEST_WORKERS, image_process_mode="merge"):
+        """批量处理文件夹中所有PDF的主函数
 
-        print("\n✅ 所有图片已保存到数据库")
+        - 进程池负责CPU密集的版面解析与页面渲染，多个文件并行准备；
+        - 文本、图片各一个模型线程，从所有已准备好的文档中取数据跨文档组批编码；
+        - 每个批次写库后记入对应文档的入库清单，中断后重新运行会跳过已完成的批次。
 
-    def process_documents(self):
-        """处理文档的主函数"""
+        Args:
+            workers: 解析渲染进程数
+            image_process_mode: "single" 或 "merge"
+        """
         try:
             # 检查PDF文件夹
             if not os.path.exists(self.pdf_folder):
                 print(f"错误: PDF文件夹 {self.pdf_folder} 不存在")
                 return
             
-            pdf_files = [f for f in os.listdir(self.pdf_folder) if f.endswith('.pdf')]
+            pdf_files = sorted(f for f in os.listdir(self.pdf_folder) if f.endswith('.pdf'))
             if not pdf_files:
                 print(f"警告: 在 {self.pdf_folder} 中没有找到PDF文件")
                 return
                 
-            print(f"找到 {len(pdf_files)} 个PDF文件")
-            
-            # 处理每个PDF文件
-            for filename in pdf_files:
-                # 为每个文档生成唯一ID
-                pdf_path="/root/MMRAG/05-03-18-political-release.pdf"
-                doc_id = self.generate_document_id()
-                # pdf_path = os.path.join(self.pdf_folder, filename)
-                
-                print(f"处理文档 {pdf_path} ")
-                
-                # 1. 提取文本
-                text_blocks = self.extract_text_from_pdf(pdf_path)
-                print("extract text done")
-                self.process_text_blocks(text_blocks, doc_id)
-                print("process text done")
-                
-                # 2. 转换为图片并处理
-                images = self.convert_pdf2image(pdf_path)
-                print("convert pdf2image done")
-                self.process_images(images, doc_id)
-                print("process images done")
+            print(f"找到 {len(pdf_files)} 个PDF文件，使用 {workers} 个解析进程")
+
+            self.text_cache = EmbeddingCache(self.text_embedder.cache_namespace()) if EMBEDDING_CACHE_ENABLED else None
+            self.image_cache = EmbeddingCache(self.image_embedder.cache_namespace()) if EMBEDDING_CACHE_ENABLED else None
+
+            progress = _IngestProgress()
+            text_queue, image_queue = queue.Queue(), queue.Queue()
+            pbar = tqdm(desc="向量化入库", unit="条")
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="model") as model_threads:
+                model_futures = [
+                    model_threads.submit(
+                        Pipeline("text", _iter_queue(text_queue))
+                        .add_stage("embed", self._make_embed_stage(self._embed_texts, "文本", progress),
+                                   batch_size=INGEST_TEXT_BATCH_SIZE)
+                        .add_stage("upsert", self._make_commit_stage(self.text_db, progress, pbar))
+                        .run
+                    ),
+                    model_threads.submit(
+                        Pipeline("image", _iter_queue(image_queue))
+                        .add_stage("embed", self._make_embed_stage(self._embed_images, "图片", progress),
+                                   batch_size=IMAGE_MAX_BATCH_SIZE)
+                        .add_stage("upsert", self._make_commit_stage(self.image_db, progress, pbar))
+                        .run
+                    ),
+                ]
+
+                # 子进程使用spawn启动，避免fork已初始化CUDA的父进程
+                mp_context = multiprocessing.get_context("spawn")
+                try:
+                    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+                        futures = {}
+                        for filename in pdf_files:
+                            pdf_path = os.path.join(self.pdf_folder, filename)
+                            # 在主进程中计算内容哈希，文档库中两个分支都已完成的文档不再提交解析渲染
+                            doc_hash = file_content_hash(pdf_path)
+                            if self._already_ingested(doc_hash, image_process_mode):
+                                progress.skip_file(filename)
+                                continue
+                            futures[pool.submit(prepare_document, pdf_path, self.output_folder,
+                                                image_process_mode, doc_hash)] = filename
+                        for future in concurrent.futures.as_completed(futures):
+                            try:
+                                prepared = future.result()
+                            except Exception as e:
+                                progress.fail_file(futures[future], e)
+                                continue
+                            self._dispatch(prepared, image_process_mode, progress, text_queue, image_queue)
+                finally:
+                    text_queue.put(None)
+                    image_queue.put(None)
+
+                try:
+                    for future in model_futures:
+                        future.result()
+                finally:
+                    progress.abort_pending()
+
+            pbar.close()
+            progress.summary()
         finally:
             self.close()
 
+    @staticmethod
+    def _already_ingested(doc_hash, image_process_mode):
+        """文档库中该内容的文档是否已按相同图片处理模式完成文本与图片两个分支"""
+        record = ChunkStore().get_document(doc_hash[:16])
+        if record is None or record["image_process_mode"] != image_process_mode:
+            return False
+        return all(record["stage_status"].get(stage) == "done" for stage in ("text", "image"))
+
+    def _dispatch(self, prepared, image_process_mode, progress, text_queue, image_queue):
+        """将一个准备好的文档拆成条目放入模型队列，已在入库清单中的条目直接跳过"""
+        doc = Document(
+            prepared["pdf_path"], self.text_db, self.image_db, self.text_embedder, self.image_embedder,
+            output_folder=self.output_folder, image_process_mode=image_process_mode,
+            doc_hash=prepared["doc_hash"]
+        )
+        doc.text_blocks = prepared["text_blocks"]
+        doc.text_pages = prepared["text_pages"]
+        doc.images = prepared["images"]
+        doc.page_count = prepared["page_count"]
+        for stage in ("text", "image"):
+            doc._set_stage(stage, "running")
+
+        modality = doc._image_modality()
+        pages = prepared["merged_images"] if image_process_mode == "merge" else prepared["images"]
+        text_items = doc._pending("text", list(enumerate(doc.text_blocks)))
+        image_items = doc._pending(modality, list(enumerate(pages)))
+
+        progress.add_file(doc, prepared, len(text_items) + len(image_items))
+        for i, text in text_items:
+            text_queue.put((doc, "text", i, text))
+        for i, item in image_items:
+            image_queue.put((doc, modality, i, item))
+
     def __del__(self):
         """析构函数，确保关闭所有连接"""
-        self.close() 
\ No newline at end of file
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量处理文件夹中的PDF并写入向量数据库")
+    parser.add_argument("--folder", default=PDF_FOLDER, help="PDF文件夹路径")
+    parser.add_argument("--output", default=PROCESS_IMAGE_OUTPUT_FOLDER, help="页面图片输出文件夹")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="解析渲染进程数")
+    parser.add_argument("--image-mode", choices=["single", "merge"], default="merge",
+                        help="图片处理模式：single-单页，merge-相邻页合并")
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(pdf_folder=args.folder, output_folder=args.output)
+    processor.process_documents(workers=args.workers, image_process_mode=args.image_mode)
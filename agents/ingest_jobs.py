@@ -0,0 +1,113 @@
+import itertools
+import threading
+import time
+import concurrent.futures
+
+from config.settings import INGEST_JOB_WORKERS
+
+# 状态的中文显示
+STATUS_LABELS = {
+    "queued": "排队中",
+    "pending": "等待中",
+    "running": "进行中",
+    "done": "已完成",
+    "failed": "失败",
+}
+
+
+class IngestJob:
+    """单个后台入库任务"""
+
+    def __init__(self, job_id, document, mode):
+        self.job_id = job_id
+        self.document = document
+        self.mode = mode
+        self.status = "queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def report(self):
+        """生成任务进度的文字描述"""
+        doc = self.document
+        elapsed = (self.finished_at or time.time()) - (self.started_at or self.submitted_at)
+        lines = [
+            f"任务 #{self.job_id} {doc.filename} (ID: {doc.doc_id})",
+            f"状态: {STATUS_LABELS[self.status]}，用时 {elapsed:.0f}s",
+        ]
+        for stage, name in (("text", "文本块"), ("image", "页面图片")):
+            if self.mode not in ("all", stage):
+                continue
+            total = doc.stage_total(stage)
+            progress = f"{doc.stage_progress[stage]}/{total if total is not None else '?'}"
+            lines.append(f"{name}: {STATUS_LABELS[doc.stage_status[stage]]} {progress}")
+        if self.error:
+            lines.append(f"错误: {self.error}")
+        return "\n".join(lines)
+
+
+class IngestJobManager:
+    """后台入库任务队列（单例模式）
+
+    上传后立即返回任务，文档处理在后台线程中进行，界面通过 get/report 轮询进度。
+    文档各分支完成时调用提交任务时给出的 on_stage_change 回调，
+    便于文本分支完成后先以文本模式提供检索，图片分支继续在后台执行。
+    """
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(IngestJobManager, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, max_workers=INGEST_JOB_WORKERS):
+        if not self._initialized:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="ingest-job"
+            )
+            self._jobs = {}
+            self._ids = itertools.count(1)
+            self._lock = threading.Lock()
+            self._initialized = True
+
+    def submit(self, document, mode="all", on_stage_change=None):
+        """提交入库任务
+
+        Args:
+            document: 待处理的Document对象
+            mode: document_process 的处理模式
+            on_stage_change: 回调 (document, stage, status)，在后台线程中调用
+
+        Returns:
+            IngestJob: 可用于轮询状态的任务对象
+        """
+        with self._lock:
+            job = IngestJob(next(self._ids), document, mode)
+            self._jobs[job.job_id] = job
+        document.on_stage_change = on_stage_change
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            success = job.document.document_process(job.mode)
+            job.status = "done" if success else "failed"
+            if not success:
+                job.error = "文档处理失败，详见日志"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        """按提交顺序返回所有任务"""
+        with self._lock:
+            return list(self._jobs.values())
@@ -0,0 +1,54 @@
+import os
+import time
+
+from agents.document import Document
+
+
+def prepare_document(pdf_path, output_folder, image_process_mode="merge", doc_hash=None):
+    """在子进程中完成单个PDF的CPU密集型准备工作（不加载任何模型、不连接数据库）
+
+    包括版面解析切块、逐页渲染保存，以及merge模式下的相邻页拼接。
+    结果只包含文本和图片路径，体积很小，可直接跨进程传回主进程。
+
+    Args:
+        pdf_path: PDF文件路径
+        output_folder: 图片输出根目录
+        image_process_mode: "single" 或 "merge"
+        doc_hash: 主进程已计算好的文档内容哈希，为None时在子进程中读取文件计算
+
+    Returns:
+        dict: 文档哈希、文本块、页面信息、拼接图片信息及各阶段耗时
+    """
+    start_time = time.time()
+    doc = Document(pdf_path, None, None, None, None,
+                   output_folder=output_folder, image_process_mode=image_process_mode, doc_hash=doc_hash)
+
+    doc._extract_text()
+    text_time = time.time() - start_time
+
+    if image_process_mode == "merge":
+        merged_pages = []
+        for merged in doc._iter_merged_pages(doc._iter_pages()):
+            merged.pop("image", None)
+            merged_pages.append(merged)
+    else:
+        merged_pages = []
+        doc._convert_to_images()
+    # 主进程从磁盘读取这些页面，返回前必须全部写盘完成；内存图片不跨进程传递
+    doc.image_writer.flush()
+    for page in doc.images:
+        page.pop("image", None)
+    image_time = time.time() - start_time - text_time
+
+    return {
+        "pdf_path": pdf_path,
+        "filename": os.path.basename(pdf_path),
+        "doc_hash": doc.doc_hash,
+        "page_count": doc.page_count,
+        "text_blocks": doc.text_blocks,
+        "text_pages": doc.text_pages,
+        "images": doc.images,
+        "merged_images": merged_pages,
+        "text_time": text_time,
+        "image_time": image_time,
+    }
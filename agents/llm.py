@@ -15,6 +15,7 @@ class myVLM:
 
     def create_messages(self,image_path,system_prompt):
         import base64
+        from utils.image_utils import image_mime_type
 
         def encode_image(image_path):
             with open(image_path, "rb") as image_file:
@@ -36,7 +37,7 @@ class myVLM:
 
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{base64_image}"}, 
+                            "image_url": {"url": f"data:{image_mime_type(image_path)};base64,{base64_image}"}, 
                         },
                         
                     ],
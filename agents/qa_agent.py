@@ -11,6 +11,8 @@ from langchain_openai import ChatOpenAI
 from agents.document import Document
 from agents.prompt1 import INTENT_RECOGNITION_PROMPT,TEXT_EVIDENCE_EXTRACT_PROMPT,IMAGE_EVIDENCE_EXTRACT_PROMPT,CRITIC_EVIDENCE_PROMPT,ANSWER_PROMPT
 from agents.llm import myVLM
+from models.chunk_store import ChunkStore
+from config.settings import PRINT_WORKFLOW_GRAPH
 import json
 import concurrent.futures
 import re
@@ -112,7 +114,8 @@ class QAAgent:
 
 
             # 绘制workflow
-            print(self.workflow.get_graph().draw_mermaid())
+            if PRINT_WORKFLOW_GRAPH:
+                print(self.workflow.get_graph().draw_mermaid())
 
             self._initialized = True
     
@@ -158,6 +161,7 @@ class QAAgent:
         question = state['query'] if key not in state or not state[key] else state[key]
 
         results = self.search_agent.search(document_obj=state['document_obj'], query=question, search_type=state['mode'])
+        print("检索耗时: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in results["timings"].items()))
 
         key = "evidence"
         if key not in state or not state[key]:
@@ -175,9 +179,16 @@ class QAAgent:
                 tasks.append(('image', image_path, sp))
 
         if state['mode'] in ("text", "all"):
-            for each in results["text_results"].points:
-                sp = TEXT_EVIDENCE_EXTRACT_PROMPT.format(
-                    query=question, context=state['document_obj'].text_blocks[each.id])
+            text_points = results["text_results"].points
+            # 一次批量查询取回命中文本块的原文，存储中没有原文的旧数据点跳过
+            entries = ChunkStore().get_entries([each.id for each in text_points])
+            for each in text_points:
+                entry = entries.get(str(each.id))
+                if not entry or entry["text"] is None:
+                    print(f"文本块存储中没有数据点 {each.id} 的原文，跳过")
+                    continue
+                context = entry["text"]
+                sp = TEXT_EVIDENCE_EXTRACT_PROMPT.format(query=question, context=context)
                 tasks.append(('text', sp))
 
         # 用线程池并行处理
@@ -1,7 +1,15 @@
-from models.embedder import ColQwen2Embedder, ColBertEmbedder
-from models.database import QdrantManager
+import concurrent.futures
+import time
 
-from config.settings import DB_NAME, DB_PATH,DB_NAME1,DB_PATH1
+from models.query_cache import QueryEmbeddingCache
+from models.sparse_embedder import SparseTextEmbedder
+
+from config.settings import DB_NAME, DB_PATH,DB_NAME1,DB_PATH1, PREFETCH_CANDIDATES, SEARCH_BACKEND, \
+    HYBRID_TEXT_SEARCH, DEFAULT_SCORE_THRESHOLD
+
+# 检索结果只需要这些负载字段（图片证据抽取用 image_path，文本证据按 chunk_index 取原文）
+IMAGE_PAYLOAD_FIELDS = ["doc_id", "pdf_filename", "page_num", "image_path"]
+TEXT_PAYLOAD_FIELDS = ["doc_id", "chunk_index"]
 
 class SearchAgent:
     """搜索代理类（单例模式）"""
@@ -22,16 +30,32 @@ class SearchAgent:
             # # 初始化两个数据库连接
             # self.image_db = QdrantManager(DB_PATH, "image_collection")
             # self.text_db = QdrantManager(DB_PATH1, "text_collection")
+
+            # ColQwen2与ColBERT共用的查询向量缓存
+            self.query_cache = QueryEmbeddingCache()
             
             self._initialized = True
 
-    def search_images(self, document_obj,query: str, limit: int = 5, score_threshold: float = 0.5):
+    def _encode_query(self, embedder, query):
+        """经LRU缓存编码查询，重复查询不再经过模型"""
+        return self.query_cache.get_or_compute(
+            embedder.cache_namespace(), query, lambda q: embedder.get_query_embeddings([q])[0]
+        )
+
+    def query_cache_stats(self):
+        """查询向量缓存的命中统计"""
+        return self.query_cache.stats()
+
+    def search_images(self, document_obj,query: str, limit: int = 5, score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+                      candidates: int = PREFETCH_CANDIDATES, backend: str = SEARCH_BACKEND):
         """搜索相关图片
         
         Args:
             query: 查询文本
             limit: 返回结果数量
-            score_threshold: 相似度阈值
+            score_threshold: 每个查询token的平均相似度阈值，为None时不过滤
+            candidates: 两阶段检索第一阶段召回的候选数
+            backend: 检索后端，"qdrant" 或 "numpy"（文档目录下的本地MaxSim索引）
             
         Returns:
             list: 匹配的图片结果列表
@@ -43,14 +67,23 @@ class SearchAgent:
 
         try:
             # 使用ColQwen2生成查询向量
-            query_vector = image_embedder.get_text_embedding(query)
+            query_vector = self._encode_query(image_embedder, query)
             
+            if backend == "numpy":
+                index = document_obj.maxsim_index(document_obj._image_modality())
+                if len(index):
+                    return index.search(query_vector, limit, score_threshold, IMAGE_PAYLOAD_FIELDS)
+                print(f"文档 {document_obj.doc_id} 没有本地MaxSim索引（入库时未开启 MAXSIM_INDEX_ENABLED），回退到Qdrant检索")
+
             # 在图片集合中搜索
             search_results = image_db.search(
                 document_obj.doc_id,
-                query_vector, 
+                query_vector.tolist(), 
                 limit=limit, 
-                score_threshold=score_threshold
+                score_threshold=score_threshold,
+                candidates=candidates,
+                payload_fields=IMAGE_PAYLOAD_FIELDS,
+                modality=document_obj._image_modality()
             )
             
             
@@ -59,13 +92,16 @@ class SearchAgent:
             print(f"图片搜索出错: {str(e)}")
             return []
 
-    def search_texts(self,document_obj,query: str, limit: int = 5, score_threshold: float = 0.5):
+    def search_texts(self,document_obj,query: str, limit: int = 5, score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+                     candidates: int = PREFETCH_CANDIDATES, backend: str = SEARCH_BACKEND):
         """搜索相关文本
         
         Args:
             query: 查询文本
             limit: 返回结果数量
-            score_threshold: 相似度阈值
+            score_threshold: 每个查询token的平均相似度阈值，为None时不过滤
+            candidates: 两阶段检索第一阶段召回的候选数
+            backend: 检索后端，"qdrant" 或 "numpy"（文档目录下的本地MaxSim索引）
             
         Returns:
             list: 匹配的文本结果列表
@@ -77,16 +113,25 @@ class SearchAgent:
 
         try:
             # 使用ColBERT生成查询向量
-            query_vector = text_embedder.get_text_embedding(query)
-            print(query_vector)
+            query_vector = self._encode_query(text_embedder, query)
             # query_vector = query_embedding # 取平均得到单个向量
             
-            # 在文本集合中搜索
+            if backend == "numpy":
+                index = document_obj.maxsim_index("text")
+                if len(index):
+                    return index.search(query_vector, limit, score_threshold, TEXT_PAYLOAD_FIELDS)
+                print(f"文档 {document_obj.doc_id} 没有本地MaxSim索引（入库时未开启 MAXSIM_INDEX_ENABLED），回退到Qdrant检索")
+
+            # 在文本集合中搜索（启用混合检索时与BM25结果做RRF融合）
+            sparse_vector = SparseTextEmbedder().get_query_embedding(query) if HYBRID_TEXT_SEARCH else None
             search_results = text_db.search(
                 document_obj.doc_id,
                 query_vector.tolist(), 
                 limit=limit, 
-                score_threshold=score_threshold
+                score_threshold=score_threshold,
+                candidates=candidates,
+                payload_fields=TEXT_PAYLOAD_FIELDS,
+                sparse_vector=sparse_vector
             )
             
             return search_results
@@ -94,40 +139,67 @@ class SearchAgent:
             print(f"文本搜索出错: {str(e)}")
             return []
 
-    def search(self, document_obj, query: str, limit: int = 2, score_threshold: float = 0.5, search_type="all"):
+    def search(self, document_obj, query: str, limit: int = 2, score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+               search_type="all", candidates: int = PREFETCH_CANDIDATES, backend: str = SEARCH_BACKEND):
         """统一搜索接口
+
+        search_type为"all"时图片与文本两个分支（各自的编码+数据库查询）在线程池中并发执行，
+        总耗时取决于较慢的分支而不是两者之和。
         
         Args:
             query: 查询文本
             limit: 每种类型返回的结果数量
-            score_threshold: 相似度阈值
+            score_threshold: 每个查询token的平均相似度阈值，为None时不过滤
             search_type: 搜索类型，可选值："all"、"image"、"text"
+            candidates: 两阶段检索第一阶段召回的候选数
+            backend: 检索后端，"qdrant" 或 "numpy"（文档目录下的本地MaxSim索引）
             
         Returns:
-            dict: 包含图片和文本搜索结果的字典
+            dict: 包含图片和文本搜索结果的字典，timings 中为各分支及总耗时（秒）
         """
         results = {
             "image_results": [],
-            "text_results": []
+            "text_results": [],
+            "timings": {}
         }
-        
+
+        branches = {}
+        if search_type in ["all", "image"]:
+            branches["image"] = lambda: self.search_images(
+                document_obj,
+                query, 
+                limit=3, 
+                score_threshold=score_threshold,
+                candidates=candidates,
+                backend=backend
+            )
+        if search_type in ["all", "text"]:
+            branches["text"] = lambda: self.search_texts(
+                document_obj,
+                query, 
+                limit=5, 
+                score_threshold=score_threshold,
+                candidates=candidates,
+                backend=backend
+            )
+
+        def timed(func):
+            branch_start = time.time()
+            return func(), time.time() - branch_start
+
+        start_time = time.time()
         try:
-            if search_type in ["all", "image"]:
-                results["image_results"] = self.search_images(
-                    document_obj,
-                    query, 
-                    limit=3, 
-                    score_threshold=score_threshold
-                )
-                
-            if search_type in ["all", "text"]:
-                results["text_results"] = self.search_texts(
-                    document_obj,
-                    query, 
-                    limit=5, 
-                    score_threshold=score_threshold
-                )
-                
+            if len(branches) > 1:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=len(branches)) as executor:
+                    futures = {name: executor.submit(timed, func) for name, func in branches.items()}
+                    outcomes = {name: future.result() for name, future in futures.items()}
+            else:
+                outcomes = {name: timed(func) for name, func in branches.items()}
+
+            for name, (branch_results, branch_time) in outcomes.items():
+                results[f"{name}_results"] = branch_results
+                results["timings"][name] = branch_time
+            results["timings"]["total"] = time.time() - start_time
             return results
         except Exception as e:
             print(f"搜索出错: {str(e)}")
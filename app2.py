@@ -1,48 +1,88 @@
+import time
+
+# 记录启动开始时间，用于启动耗时报告
+startup_begin = time.time()
+
 import gradio as gr
 import random
-import time
 import os
 import shutil
+import threading
+import subprocess
 from agents.document import Document
-from agents.qa_agent import QAAgent
-from models.embedder import ColQwen2Embedder, ColBertEmbedder
-from models.database import QdrantManager
-from config.settings import PROCESS_IMAGE_OUTPUT_FOLDER, DB_PATH, DB_PATH1, DEFAULT_BATCH_SIZE
+from agents.ingest_jobs import IngestJobManager, STATUS_LABELS
+from models.chunk_store import ChunkStore
+from config.settings import PROCESS_IMAGE_OUTPUT_FOLDER, DB_PATH, DB_PATH1, DEFAULT_BATCH_SIZE, MODEL_WARMUP, \
+    EMBED_SERVER_ENABLED
+from utils.lazy import LazyComponent, start_warmup, startup_report
 
+_download_proxies = None
+_download_proxies_lock = threading.Lock()
 
-# 初始化数据库连接和embedder（全局只需要一次）
-text_db = QdrantManager(DB_PATH1, "text_collection")
-image_db = QdrantManager(DB_PATH, "image_collection")
-import subprocess
-import os
 
-# 保存原始的环境变量
-original_env = {var: os.environ.get(var) for var in ['http_proxy', 'https_proxy', 'no_proxy']}
+def download_proxies():
+    """读取学术加速代理配置，供模型下载请求显式使用
 
-# 改变环境变量
-result = subprocess.run('bash -c "source /etc/network_turbo && env | grep proxy"', shell=True, capture_output=True, text=True)
-output = result.stdout
-for line in output.splitlines():
-    if '=' in line:
-        var, value = line.split('=', 1)
-        os.environ[var] = value
-        print(var, value)
+    只解析 /etc/network_turbo 导出的代理变量，不修改当前进程的环境变量，
+    Gradio 服务线程以及之后创建的 OpenAI/httpx 客户端都不会经过该代理。
 
+    Returns:
+        dict: requests风格的代理配置，如 {"http": ..., "https": ...}；没有代理时返回None
+    """
+    global _download_proxies
+    with _download_proxies_lock:
+        if _download_proxies is None:
+            result = subprocess.run('bash -c "source /etc/network_turbo && env | grep proxy"', shell=True,
+                                    capture_output=True, text=True)
+            env = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+            proxies = {}
+            for scheme in ("http", "https", "no"):
+                value = env.get(f"{scheme}_proxy") or env.get(f"{scheme.upper()}_PROXY")
+                if value:
+                    proxies["no_proxy" if scheme == "no" else scheme] = value
+            print(f"模型下载代理: {proxies or '无'}")
+            _download_proxies = proxies
+        return _download_proxies or None
 
-text_embedder = ColBertEmbedder()
-image_embedder = ColQwen2Embedder()
 
+def _load_text_embedder():
+    if EMBED_SERVER_ENABLED:
+        from models.embedding_server import RemoteEmbedder
+        return RemoteEmbedder("colbert")
+    from models.embedder import ColBertEmbedder
+    return ColBertEmbedder(proxies=download_proxies())
 
 
-# 后面需要恢复的时候
-for var, value in original_env.items():
-    if value is None:
-        os.environ.pop(var, None)  # 原本没有，就删掉
-    else:
-        os.environ[var] = value     # 原本有，就还原成原来的值有，就还原成原来的值
-        
-        
-qa_agent = QAAgent()
+def _load_image_embedder():
+    if EMBED_SERVER_ENABLED:
+        from models.embedding_server import RemoteEmbedder
+        return RemoteEmbedder("colqwen2")
+    from models.embedder import ColQwen2Embedder
+    return ColQwen2Embedder(proxies=download_proxies())
+
+
+def _load_qdrant(db_path, collection_name):
+    from models.database import QdrantManager
+    return QdrantManager(db_path, collection_name)
+
+
+def _load_qa_agent():
+    from agents.qa_agent import QAAgent
+    return QAAgent()
+
+
+# 数据库连接、embedder和问答代理均在首次使用时才初始化（全局只需要一次）；
+# 仅使用文本检索的会话不会加载ColQwen2
+text_db = LazyComponent("文本数据库", lambda: _load_qdrant(DB_PATH1, "text_collection"))
+image_db = LazyComponent("图片数据库", lambda: _load_qdrant(DB_PATH, "image_collection"))
+text_embedder = LazyComponent("ColBERT模型", _load_text_embedder)
+image_embedder = LazyComponent("ColQwen2模型", _load_image_embedder)
+qa_agent = LazyComponent("问答代理", _load_qa_agent)
+
+# 预热顺序：先加载文本检索所需组件，最后加载最慢的ColQwen2
+components = [text_db, text_embedder, qa_agent, image_db, image_embedder]
+
+ingest_jobs = IngestJobManager()
 
 # 定义检索模式
 SEARCH_MODES = {
@@ -61,12 +101,66 @@ IMAGE_PROCESS_MODES = {
 current_doc = None
 current_mode = "all"  
 current_image_mode = "single"  # 默认使用single模式
+current_job = None  # 最近一次提交的后台入库任务
+_current_lock = threading.Lock()  # 保护 current_doc/current_job 在界面线程与后台入库线程之间的切换
 uploaded_folder = "uploaded_docs"
 os.makedirs(uploaded_folder, exist_ok=True)
 
-def process_pdf(file, history):
-    """处理上传的PDF文件"""
+def activate_document(doc, stage, status):
+    """入库分支完成后切换当前文档（在后台入库线程中调用）
+
+    文本分支先完成时即可切换，文档先以文本模式提供检索，图片分支继续在后台执行。
+    只有该文档仍是最近提交的任务时才切换：用户在入库期间打开或上传了其他文档时保持用户的选择。
+    """
     global current_doc
+
+    if status != "done":
+        return
+    with _current_lock:
+        if current_doc is doc or current_job is None or current_job.document is not doc:
+            return
+        # 更新当前文档；之前的文档保留在文档库中，可以随时重新打开
+        current_doc = doc
+
+def registry_choices():
+    """文档库下拉框的选项：(显示名称, 文档ID)"""
+    choices = []
+    for record in ChunkStore().list_documents():
+        status = "/".join(STATUS_LABELS.get(status, status) for status in record["stage_status"].values())
+        choices.append((f"{record['filename']} ({record['doc_id'][:8]}, {status})", record["doc_id"]))
+    return choices
+
+def refresh_registry():
+    return gr.update(choices=registry_choices())
+
+def open_document(doc_id):
+    """从文档库重新打开已入库的文档，复用已有的向量和页面图片"""
+    global current_doc, current_job
+
+    if not doc_id:
+        return "请选择要打开的文档", gr.update()
+    try:
+        start_time = time.time()
+        record = ChunkStore().get_document(doc_id)
+        if record is None:
+            return "文档库中没有该文档", gr.update()
+        doc = Document.from_record(record, text_db, image_db, text_embedder, image_embedder)
+        with _current_lock:
+            current_doc = doc
+            current_job = None
+        mode = current_doc.searchable_mode("all")
+        message = f"已打开 {record['filename']}，用时 {(time.time() - start_time) * 1000:.0f} 毫秒"
+        if mode is None:
+            message += "\n该文档上次未完成入库，请重新上传以继续处理"
+        elif mode != "all":
+            message += f"\n仅支持 {mode} 检索，重新上传可补全未完成的分支"
+        return message, []
+    except Exception as e:
+        return f"打开文档失败: {str(e)}", gr.update()
+
+def process_pdf(file, history):
+    """处理上传的PDF文件：提交后台入库任务后立即返回"""
+    global current_job
     
     try:
         if not file:
@@ -88,33 +182,35 @@ def process_pdf(file, history):
             image_process_mode=current_image_mode  # 使用当前选择的图片处理模式
         )
         
-        # 处理文档
-        success = doc.document_process()
-        if not success:
-            return f"文档处理失败: {filename}", history
-            
-        # 更新当前文档
-        if current_doc:
-            try:
-                current_doc.delete()  # 删除旧文档
-            except:
-                pass
-                
-        current_doc = doc
+        # 后台处理文档；持锁提交，保证分支完成回调看到的是本次任务
+        with _current_lock:
+            current_job = ingest_jobs.submit(doc, mode="all", on_stage_change=activate_document)
         
         # 清空聊天历史
-        return f"文档上传并处理成功！\nID: {doc.doc_id}\n文本块数量: {len(doc.text_blocks)}\n图片数量: {len(doc.images)}", []
+        return f"文档已加入后台处理队列\n{current_job.report()}", []
         
     except Exception as e:
         return f"文档处理失败: {str(e)}", history
 
+def poll_ingest_status():
+    """定时刷新后台入库任务的进度"""
+    if current_job is None:
+        return gr.update()
+    return current_job.report()
+
 def delete_current_pdf():
     """删除当前PDF文档"""
-    global current_doc
+    global current_doc, current_job
     
     if not current_doc:
-        return None, None, None
-        
+        return None, None, None, gr.update()
+
+    # 入库任务仍在写入该文档时不能删除，否则任务会继续写入数据点并把文档重新登记到文档库
+    running = [job for job in ingest_jobs.jobs()
+               if job.document.doc_id == current_doc.doc_id and job.status in ("queued", "running")]
+    if running:
+        return gr.update(), f"文档仍在后台处理中，请等待完成后再删除\n{running[-1].report()}", gr.update(), gr.update()
+
     try:
         # 删除文档数据
         current_doc.delete()
@@ -123,12 +219,14 @@ def delete_current_pdf():
         if os.path.exists(current_doc.pdf_path):
             os.remove(current_doc.pdf_path)
             
-        current_doc = None
-        # 返回None来清空file_upload和upload_output，以及chatbot历史
-        return None, None, []
+        with _current_lock:
+            current_doc = None
+            current_job = None
+        # 返回None来清空file_upload和upload_output，以及chatbot历史，并刷新文档库
+        return None, None, [], gr.update(choices=registry_choices(), value=None)
         
     except Exception as e:
-        return None, None, None
+        return None, None, None, gr.update()
 
 def bot(history: list):
     print(history)
@@ -137,9 +235,18 @@ def bot(history: list):
         yield history
         return
             
+    # 图片分支尚未完成时降级为当前可用的检索模式
+    mode = current_doc.searchable_mode(current_mode)
+    if mode is None:
+        history.append({"role": "assistant", "content": "文档仍在处理中，请稍后再试"})
+        yield history
+        return
+    if mode != current_mode:
+        print(f"文档尚未完全入库，检索模式由 {current_mode} 降级为 {mode}")
+            
     print(history)
     # 根据当前模式进行检索
-    bot_message = qa_agent.run(history, current_doc, mode=current_mode)
+    bot_message = qa_agent.run(history, current_doc, mode=mode)
     history.append({"role": "assistant", "content": bot_message})
     yield history
 
@@ -177,7 +284,14 @@ with gr.Blocks(title="智能PDF问答系统",theme=gr.themes.Soft()) as demo:
             file_upload = gr.File(label="选择PDF文件")
             upload_button = gr.Button("上传并处理PDF")
             upload_output = gr.Textbox(label="上传结果")
+            status_timer = gr.Timer(2)
             delete_button = gr.Button("删除当前PDF")
+
+            # 文档库：重启后直接打开之前入库的文档，无需重新上传
+            doc_select = gr.Dropdown(choices=registry_choices(), label="已入库文档")
+            with gr.Row():
+                open_button = gr.Button("打开文档")
+                refresh_button = gr.Button("刷新列表")
             
         with gr.Column(scale=2):
             # 聊天部分
@@ -200,11 +314,25 @@ with gr.Blocks(title="智能PDF问答系统",theme=gr.themes.Soft()) as demo:
         show_progress_on=upload_output
     )
     
+    # 定时刷新后台处理进度
+    status_timer.tick(
+        poll_ingest_status,
+        outputs=[upload_output],
+    )
+    
     # 处理PDF删除
     delete_button.click(
         delete_current_pdf,
-        outputs=[file_upload, upload_output, chatbot],
+        outputs=[file_upload, upload_output, chatbot, doc_select],
+    )
+
+    # 文档库
+    open_button.click(
+        open_document,
+        inputs=[doc_select],
+        outputs=[upload_output, chatbot],
     )
+    refresh_button.click(refresh_registry, outputs=[doc_select])
     
     # 处理模式切换
     mode_select.change(
@@ -227,4 +355,10 @@ with gr.Blocks(title="智能PDF问答系统",theme=gr.themes.Soft()) as demo:
     clear.click(lambda: [], None, chatbot, queue=False)
 
 if __name__ == "__main__":
+    print(f"✅ 界面构建完成，启动用时 {time.time() - startup_begin:.2f} 秒")
+    print(f"文档库中共有 {len(ChunkStore().list_documents())} 个已入库文档")
+    if MODEL_WARMUP:
+        start_warmup(components)
+    else:
+        print(startup_report(components))
     demo.launch()
\ No newline at end of file
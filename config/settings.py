@@ -27,5 +27,115 @@ VECTOR_SIZE = 128
 
 # 搜索配置
 DEFAULT_LIMIT = 5
-DEFAULT_SCORE_THRESHOLD = 0.7
+# 相似度阈值按每个查询token的平均MaxSim相似度解释（检索时乘以查询token数）；
+# 尚未在评测集上校准，默认不过滤，只按 limit 截取。混合检索时阈值只作用于多向量一路，BM25一路不受影响
+DEFAULT_SCORE_THRESHOLD = None
 DEFAULT_BATCH_SIZE = 1
+
+# PDF渲染配置
+PDF_PAGE_WINDOW = 4  # 每个渲染窗口的页数，决定渲染阶段的峰值内存
+PDF_CONVERT_THREADS = 4  # 单个窗口内的pdf2image转换线程数
+
+# 入库流水线配置
+INGEST_PIPELINE_ENABLED = True  # mode='all'时文本与图片分支并发执行
+PIPELINE_QUEUE_SIZE = 8  # 流水线阶段之间队列的最大长度
+
+# 图片向量化动态批处理配置
+IMAGE_TOKEN_BUDGET = 6144  # 单次前向传播允许的图片token总数（按批内最长图片补齐后计算）
+IMAGE_MAX_BATCH_SIZE = 8  # 单批最多图片数
+
+# 向量缓存配置
+EMBEDDING_CACHE_ENABLED = True  # 按内容哈希复用已计算过的多向量
+EMBEDDING_CACHE_DIR = "/root/autodl-tmp/embedding_cache"  # 向量缓存目录
+
+# 批量入库配置
+INGEST_WORKERS = 4  # 负责版面解析与PDF渲染的进程数
+INGEST_TEXT_BATCH_SIZE = 32  # 跨文档合并后单次ColBERT编码的文本块数
+
+# 页面图片配置
+# ColQwen2处理器默认最多编码768个视觉token（约 768*28*28 像素），超出部分会被缩放掉；
+# VLM读取证据时需要能看清正文，因此文字页保留更高的像素上限。
+PAGE_RENDER_DPI = 144  # PDF渲染DPI（pdf2image默认200）
+PAGE_PROFILE_MODE = "auto"  # 页面保存策略："auto"按页面内容自动选择，或固定为"text"/"figure"
+# auto模式的页面分类：最近邻采样后，与底色差异大的像素经腐蚀仍保留的面积比例（大块填充）超过该值判为图表页。
+# 在 uploaded_docs 中可渲染的页面上标定：文字页（含小图表）不超过0.02，半页以上的图片/图表在0.3以上
+PAGE_CLASSIFY_SIZE = 512  # 分类采样的长边像素数
+PAGE_FIGURE_FILL_RATIO = 0.25
+PAGE_PROFILES = {
+    # 文字密集页：WebP高质量，保证VLM可辨认小字号正文
+    "text": {"format": "WEBP", "quality": 90, "max_pixels": 1600 * 1200},
+    # 图表/图片密集页：有损压缩更激进，像素上限贴近ColQwen2实际使用的分辨率
+    "figure": {"format": "WEBP", "quality": 80, "max_pixels": 1024 * 28 * 28},
+}
+
+# 页面图片异步写盘配置
+IMAGE_WRITER_THREADS = 2  # 后台编码写盘线程数
+IMAGE_WRITER_MAX_PENDING = 16  # 最多排队等待写盘的图片数，超出时渲染阶段等待
+
+# 后台入库任务配置
+INGEST_JOB_WORKERS = 1  # 同时执行的入库任务数（共享同一组模型，通常保持为1）
+
+# 查询编码配置
+QUERY_BATCH_SIZE = 32  # 批量编码查询时单次前向传播的查询数
+QUERY_CACHE_SIZE = 1024  # 查询向量LRU缓存的最大条目数，0表示关闭
+
+# CPU推理配置
+# ColQwen2在CPU上的推理后端："bf16"为原始bfloat16权重；"fp32"为单精度；
+# "int8"在fp32基础上对所有Linear层做动态int8量化，CPU上延迟最低，
+# 但需先在目标机器上运行 python -m models.parity --backend int8 确认通过后再改为"int8"
+COLQWEN2_CPU_BACKEND = "bf16"
+CPU_NUM_THREADS = 0  # torch推理线程数，0表示使用torch默认值
+PARITY_MIN_COSINE = 0.95  # 量化后端与参考向量逐token余弦相似度的最低要求
+
+# 应用启动配置
+MODEL_WARMUP = True  # 界面启动后在后台线程中预加载模型和数据库
+PRINT_WORKFLOW_GRAPH = False  # 初始化QAAgent时是否打印工作流的mermaid图
+
+# 多向量池化配置
+IMAGE_POOL_FACTOR = 1  # 页面patch向量的池化倍数，1表示不池化；3表示向量数约缩减为1/3
+
+# 向量量化配置（只在 QDRANT_MODE="server" 时生效，本地与内存模式做精确检索）
+VECTOR_QUANTIZATION = "scalar"  # "scalar"(int8) / "binary" / "none"，量化向量常驻内存，原始向量仍在磁盘
+QUANTIZATION_ALWAYS_RAM = True  # 量化向量是否常驻内存
+SEARCH_RESCORE = True  # 搜索时是否用原始精度向量对候选重新打分
+SEARCH_OVERSAMPLING = 2.0  # 量化搜索的过采样倍数（取 limit*oversampling 个候选再重打分）
+
+# 向量编码服务配置
+EMBED_SERVER_ENABLED = False  # 为True时app通过独立的编码服务进程编码，多个app进程共享同一份模型
+EMBED_SERVER_ADDRESS = "/tmp/mmrag_embedder.sock"  # Unix socket路径；也可以是 ("127.0.0.1", 6010)
+EMBED_SERVER_AUTHKEY = b"mmrag-embedder"
+EMBED_SERVER_MAX_BATCH = 32  # 一个微批次最多合并的查询/图片数
+EMBED_SERVER_MAX_WAIT_MS = 5  # 微批次的最长等待时间（毫秒），超时即使未凑满也立即编码
+
+# 两阶段检索配置
+MULTIVECTOR_NAME = "multivector"  # 多向量（MaxSim重排）的向量名
+POOLED_VECTOR_NAME = "pooled"  # 均值池化单向量（HNSW召回）的向量名
+PREFETCH_CANDIDATES = 50  # 第一阶段召回的候选数，0表示直接对全部数据做MaxSim
+
+# 集合布局配置
+COLLECTION_LAYOUT = "shared"  # "shared": 所有文档共用一个集合，按doc_id（租户索引）过滤；"per_document": 每个文档一个集合
+
+# Qdrant后端配置
+QDRANT_MODE = "local"  # "local": 本地目录（单进程独占）；"server": Qdrant服务（多进程共享）；"memory": 内存（测试用）
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = 6333  # HTTP端口
+QDRANT_GRPC_PORT = 6334  # gRPC端口
+QDRANT_PREFER_GRPC = True  # 服务模式下优先使用gRPC
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_TIMEOUT = 10  # 请求超时（秒）
+
+# 本地MaxSim检索配置
+SEARCH_BACKEND = "qdrant"  # 默认检索后端："qdrant" 或 "numpy"（本地MaxSim索引，适合单文档问答）
+# 入库时同时把每个文档的多向量写入文档目录下的float16内存映射索引；
+# 使用numpy后端（全局或单次请求指定）前需要开启，未建索引的文档会回退到Qdrant检索
+MAXSIM_INDEX_ENABLED = False
+MAXSIM_CHUNK_TOKENS = 65536  # 检索时每次转为float32参与矩阵乘法的最大token数，限制单次查询的临时内存
+
+# 混合文本检索配置
+HYBRID_TEXT_SEARCH = True  # 文本检索时把BM25稀疏向量与ColBERT的结果用RRF融合
+SPARSE_MODEL_NAME = "Qdrant/bm25"  # fastembed稀疏模型
+SPARSE_VECTOR_NAME = "bm25"  # 稀疏向量名（Qdrant按IDF加权）
+HYBRID_PREFETCH_LIMIT = 20  # 融合前每一路召回的候选数
+
+# 文本块/页面存储配置
+CHUNK_STORE_PATH = "/root/autodl-tmp/mmrag_store.sqlite3"  # 文本块原文、页码、图片路径与文档元信息（SQLite）
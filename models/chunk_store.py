@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from config.settings import CHUNK_STORE_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    doc_hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    pdf_path TEXT,
+    output_folder TEXT,
+    page_count INTEGER,
+    chunk_count INTEGER,
+    image_process_mode TEXT,
+    stage_status TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    point_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    modality TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT,
+    page_num INTEGER,
+    image_path TEXT,
+    pdf_filename TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_doc ON entries (doc_id, modality, idx);
+"""
+
+_ENTRY_COLUMNS = ("point_id", "doc_id", "modality", "idx", "text", "page_num", "image_path", "pdf_filename")
+
+
+class ChunkStore:
+    """文本块与页面信息的持久化存储（单例模式，SQLite）
+
+    以数据点ID为键保存文本块原文、页码、图片路径和所属文档的元信息，
+    检索命中后一次批量查询即可取回上下文，不再依赖内存中的 Document 对象，重启后依然可用。
+    """
+    _instances = {}
+    _initialized = {}
+
+    def __new__(cls, path=CHUNK_STORE_PATH):
+        if path not in cls._instances:
+            cls._instances[path] = super(ChunkStore, cls).__new__(cls)
+        return cls._instances[path]
+
+    def __init__(self, path=CHUNK_STORE_PATH):
+        if path not in self._initialized:
+            self.path = path
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # 入库线程与检索线程共用一个连接，由锁串行化
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._lock = threading.Lock()
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(_SCHEMA)
+            self._initialized[path] = True
+
+    def upsert_document(self, document):
+        """写入或更新文档元信息"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO documents (doc_id, doc_hash, filename, pdf_path, output_folder, page_count, chunk_count,
+                                       image_process_mode, stage_status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (doc_id) DO UPDATE SET
+                    filename = excluded.filename, pdf_path = excluded.pdf_path,
+                    output_folder = excluded.output_folder, page_count = excluded.page_count,
+                    chunk_count = excluded.chunk_count, image_process_mode = excluded.image_process_mode,
+                    stage_status = excluded.stage_status, updated_at = excluded.updated_at
+                """,
+                (document.doc_id, document.doc_hash, document.filename, document.pdf_path, document.output_folder,
+                 document.page_count, document.chunk_count, document.image_process_mode,
+                 json.dumps(document.stage_status), document.created_at, datetime.now().isoformat()),
+            )
+
+    def add_entries(self, entries):
+        """批量写入条目
+
+        Args:
+            entries: 字典列表，键为 point_id、doc_id、modality、idx 以及可选的 text、page_num、image_path、pdf_filename
+        """
+        rows = [tuple(entry.get(column) for column in _ENTRY_COLUMNS) for entry in entries]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO entries ({', '.join(_ENTRY_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in _ENTRY_COLUMNS)})",
+                rows,
+            )
+
+    def get_entries(self, point_ids):
+        """按数据点ID批量查询条目
+
+        Returns:
+            dict: point_id -> 条目字典，不存在的ID不出现在结果中
+        """
+        point_ids = [str(point_id) for point_id in point_ids]
+        if not point_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM entries WHERE point_id IN ({', '.join('?' for _ in point_ids)})", point_ids
+            ).fetchall()
+        return {row["point_id"]: dict(row) for row in rows}
+
+    def get_document(self, doc_id):
+        """文档元信息，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["stage_status"] = json.loads(record["stage_status"] or "{}")
+        return record
+
+    def list_documents(self):
+        """全部已入库文档的元信息，最近更新的在前"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents ORDER BY updated_at DESC").fetchall()
+        records = [dict(row) for row in rows]
+        for record in records:
+            record["stage_status"] = json.loads(record["stage_status"] or "{}")
+        return records
+
+    def delete_document(self, doc_id):
+        """删除文档及其全部条目"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
@@ -1,6 +1,134 @@
+import os
+import threading
 import time
-from qdrant_client import models as qdrant_models, QdrantClient
-from config.settings import VECTOR_SIZE, DEFAULT_LIMIT, DEFAULT_SCORE_THRESHOLD
+import numpy as np
+from qdrant_client import QdrantClient
+# qdrant_client.models 中的 QueryResponse 会被 fastembed 的同名类覆盖，这里直接使用 http.models
+from qdrant_client.http import models as qdrant_models
+from config.settings import VECTOR_SIZE, DEFAULT_LIMIT, DEFAULT_SCORE_THRESHOLD, VECTOR_QUANTIZATION, \
+    QUANTIZATION_ALWAYS_RAM, SEARCH_RESCORE, SEARCH_OVERSAMPLING, MULTIVECTOR_NAME, POOLED_VECTOR_NAME, \
+    PREFETCH_CANDIDATES, COLLECTION_LAYOUT, QDRANT_MODE, QDRANT_HOST, QDRANT_PORT, QDRANT_GRPC_PORT, \
+    QDRANT_PREFER_GRPC, QDRANT_API_KEY, QDRANT_TIMEOUT, SPARSE_VECTOR_NAME, HYBRID_PREFETCH_LIMIT
+
+# 需要建立负载索引的字段：doc_id 标记为租户字段，Qdrant会按它组织存储，过滤检索只访问该文档的数据
+PAYLOAD_INDEXES = {
+    "doc_id": qdrant_models.KeywordIndexParams(type=qdrant_models.KeywordIndexType.KEYWORD, is_tenant=True),
+    "pdf_filename": qdrant_models.PayloadSchemaType.KEYWORD,
+    "page_num": qdrant_models.PayloadSchemaType.INTEGER,
+    "modality": qdrant_models.PayloadSchemaType.KEYWORD,
+}
+
+
+# 进程内共享的客户端：键 -> [客户端, 引用计数]
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+
+
+def _client_key(db_path, mode):
+    # 服务模式下所有集合共用一个连接；本地目录同一时刻只能被一个客户端打开；内存模式按路径区分不同的库
+    return (mode, None) if mode == "server" else (mode, db_path)
+
+
+def acquire_client(db_path, mode=QDRANT_MODE):
+    """从连接池获取Qdrant客户端，同一后端的多个QdrantManager共用一个客户端
+
+    Args:
+        db_path: 本地模式的存储目录，内存模式下作为库的标识，服务模式下忽略
+        mode: "local"、"server" 或 "memory"
+    """
+    key = _client_key(db_path, mode)
+    with _client_pool_lock:
+        if key not in _client_pool:
+            if mode == "server":
+                client = QdrantClient(
+                    host=QDRANT_HOST,
+                    port=QDRANT_PORT,
+                    grpc_port=QDRANT_GRPC_PORT,
+                    prefer_grpc=QDRANT_PREFER_GRPC,
+                    api_key=QDRANT_API_KEY,
+                    timeout=QDRANT_TIMEOUT,
+                )
+            elif mode == "memory":
+                client = QdrantClient(location=":memory:")
+            elif mode == "local":
+                client = QdrantClient(path=db_path)
+            else:
+                raise ValueError(f"不支持的Qdrant模式: {mode}")
+            _client_pool[key] = [client, 0]
+        _client_pool[key][1] += 1
+        return _client_pool[key][0]
+
+
+def release_client(db_path, mode=QDRANT_MODE):
+    """归还客户端，最后一个使用者归还时关闭连接"""
+    key = _client_key(db_path, mode)
+    with _client_pool_lock:
+        entry = _client_pool.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            entry[0].close()
+            del _client_pool[key]
+
+
+def build_quantization_config(mode=VECTOR_QUANTIZATION, always_ram=QUANTIZATION_ALWAYS_RAM):
+    """根据量化模式构造集合的量化配置
+
+    Args:
+        mode: "scalar"（int8标量量化）、"binary"（二值量化）或 "none"
+        always_ram: 量化向量是否常驻内存
+
+    Returns:
+        量化配置；mode为"none"时返回None
+    """
+    if mode == "scalar":
+        return qdrant_models.ScalarQuantization(
+            scalar=qdrant_models.ScalarQuantizationConfig(
+                type=qdrant_models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=always_ram,
+            )
+        )
+    if mode == "binary":
+        return qdrant_models.BinaryQuantization(
+            binary=qdrant_models.BinaryQuantizationConfig(always_ram=always_ram)
+        )
+    if mode == "none":
+        return None
+    raise ValueError(f"不支持的量化模式: {mode}")
+
+
+def build_vectors_config():
+    """命名向量结构：多向量只用于MaxSim重排，不需要HNSW索引；均值池化向量用于HNSW召回"""
+    return {
+        MULTIVECTOR_NAME: qdrant_models.VectorParams(
+            size=VECTOR_SIZE,
+            distance=qdrant_models.Distance.COSINE,
+            on_disk=True,
+            multivector_config=qdrant_models.MultiVectorConfig(
+                comparator=qdrant_models.MultiVectorComparator.MAX_SIM
+            ),
+            hnsw_config=qdrant_models.HnswConfigDiff(m=0),
+        ),
+        POOLED_VECTOR_NAME: qdrant_models.VectorParams(
+            size=VECTOR_SIZE,
+            distance=qdrant_models.Distance.COSINE,
+        ),
+    }
+
+
+def build_search_params(rescore=SEARCH_RESCORE, oversampling=SEARCH_OVERSAMPLING):
+    """构造量化搜索参数：先在内存中的量化向量上取 limit*oversampling 个候选，再用原始向量重打分"""
+    if VECTOR_QUANTIZATION == "none":
+        return None
+    return qdrant_models.SearchParams(
+        quantization=qdrant_models.QuantizationSearchParams(
+            ignore=False,
+            rescore=rescore,
+            oversampling=oversampling,
+        )
+    )
 
 class QdrantManager:
     """Qdrant数据库管理类（单例模式）"""
@@ -19,20 +147,30 @@ class QdrantManager:
             self.db_path = db_path
             self.collection_name = collection_name
             self.client = None
+            self.mode = QDRANT_MODE
+            self.layout = COLLECTION_LAYOUT
+            # 已确认存在的集合 -> 是否为 多向量+池化向量 的命名向量结构（旧集合为单个未命名的多向量）
+            self._named_vectors = {}
+            # 已确认存在的集合 -> 是否带有BM25稀疏向量
+            self._sparse_vectors = {}
+            self._collections_lock = threading.Lock()
+            # 最近一次搜索的耗时与命中数
+            self.last_search_stats = None
             self._init_client()
             self._initialized[key] = True
 
     def _init_client(self):
         """初始化Qdrant客户端"""
-        print("正在连接Qdrant数据库...")
-        self.client = QdrantClient(path=self.db_path)
-        self._ensure_collection_exists()
+        print(f"正在连接Qdrant数据库（{self.mode}模式）...")
+        self.client = acquire_client(self.db_path, self.mode)
+        if self.layout == "shared":
+            self._ensure_collection_exists(self.collection_name)
         print("✅ Qdrant数据库连接成功")
 
     def close(self):
         """关闭数据库连接"""
         if self.client:
-            self.client.close()
+            release_client(self.db_path, self.mode)
             self.client = None
             print("✅ 数据库连接已关闭")
 
@@ -43,8 +181,13 @@ class QdrantManager:
             collection_info = self.client.get_collection(collection_name=self.collection_name)
             print("\n数据库集合信息:")
             print(f"集合名称: {self.collection_name}")
-            print(f"向量维度: {collection_info.config.params.vectors.size}")
+            vectors = collection_info.config.params.vectors
+            vector_size = vectors[MULTIVECTOR_NAME].size if isinstance(vectors, dict) else vectors.size
+            print(f"向量维度: {vector_size}")
+            print(f"两阶段检索: {'支持' if self._named_vectors.get(self.collection_name) else '不支持（旧版集合）'}")
+            print(f"负载索引: {', '.join(collection_info.payload_schema) or '无'}")
             print(f"向量数量: {collection_info.points_count}")
+            print(f"量化配置: {collection_info.config.quantization_config}")
             
             # 获取一些示例点
             if collection_info.points_count > 0:
@@ -65,56 +208,306 @@ class QdrantManager:
         except Exception as e:
             print(f"检查数据库时出错: {str(e)}")
 
-    def _ensure_collection_exists(self):
-        """确保集合存在，如果不存在则创建"""
+    @property
+    def quantization_supported(self):
+        """只有Qdrant服务支持量化：本地/内存模式做精确检索，忽略量化配置，集合信息中也始终没有量化配置"""
+        return self.mode == "server"
+
+    def _ensure_collection_exists(self, collection_name):
+        """确保集合存在，如果不存在则创建，并补齐负载索引"""
         try:
-            collection_info = self.client.get_collection(collection_name=self.collection_name)
-            print(f"使用现有集合: {self.collection_name}")
+            collection_info = self.client.get_collection(collection_name=collection_name)
         except Exception:
-            print(f"创建新集合: {self.collection_name}")
+            collection_info = None
+
+        if collection_info is None:
+            print(f"创建新集合: {collection_name}")
             self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=qdrant_models.VectorParams(
-                    size=VECTOR_SIZE,
-                    distance=qdrant_models.Distance.COSINE,
-                    on_disk=True,
-                    multivector_config=qdrant_models.MultiVectorConfig(
-                    comparator=qdrant_models.MultiVectorComparator.MAX_SIM
-                ),
+                collection_name=collection_name,
+                vectors_config=build_vectors_config(),
+                sparse_vectors_config={
+                    SPARSE_VECTOR_NAME: qdrant_models.SparseVectorParams(modifier=qdrant_models.Modifier.IDF),
+                },
+                quantization_config=build_quantization_config() if self.quantization_supported else None,
+            )
+            named_vectors = True
+            sparse_vectors = True
+        else:
+            print(f"使用现有集合: {collection_name}")
+            vectors = collection_info.config.params.vectors
+            named_vectors = isinstance(vectors, dict) and POOLED_VECTOR_NAME in vectors
+            if not named_vectors:
+                print(f"⚠️ 集合 {collection_name} 为旧版结构（无池化向量），检索时直接做MaxSim")
+            sparse_vectors = SPARSE_VECTOR_NAME in (collection_info.config.params.sparse_vectors or {})
+            if self.quantization_supported:
+                self.migrate_quantization(collection_info, collection_name=collection_name)
+        self._ensure_payload_indexes(collection_name, collection_info)
+        self._sparse_vectors[collection_name] = sparse_vectors
+        self._named_vectors[collection_name] = named_vectors
+
+    def _ensure_payload_indexes(self, collection_name, collection_info=None):
+        """为过滤检索用到的负载字段建立索引（已有集合只补建缺失的索引）"""
+        existing = collection_info.payload_schema if collection_info else {}
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name in existing:
+                continue
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+
+    def collection_for(self, doc_id, create=False):
+        """文档所在的集合：shared布局下为共用集合，per_document布局下为该文档独占的集合
+
+        Args:
+            create: 集合不存在时是否创建，只有写入路径才创建；检索、统计等只读路径不创建，返回None
+        """
+        if self.layout != "per_document":
+            return self.collection_name
+        collection_name = f"{self.collection_name}_{doc_id}"
+        if collection_name not in self._named_vectors:
+            with self._collections_lock:
+                if collection_name not in self._named_vectors:
+                    if not create and not self.client.collection_exists(collection_name):
+                        return None
+                    self._ensure_collection_exists(collection_name)
+        return collection_name
+
+    def storage_key(self):
+        """数据点实际写入位置的标识（Qdrant模式、存储位置、集合布局与集合名），入库清单据此判断是否换了库"""
+        location = f"{QDRANT_HOST}:{QDRANT_PORT}" if self.mode == "server" else os.path.abspath(self.db_path)
+        return f"{self.mode}:{location}:{self.layout}:{self.collection_name}"
+
+    def count_points(self, doc_id, modality=None):
+        """统计文档（指定modality时只统计该模态）在库中的数据点数，集合不存在或出错时返回0"""
+        try:
+            collection_name = self.collection_for(doc_id)
+            if collection_name is None:
+                return 0
+            return self.client.count(
+                collection_name=collection_name,
+                count_filter=self._doc_filter(doc_id, modality),
+                exact=True,
+            ).count
+        except Exception as e:
+            print(f"统计数据点时出错: {str(e)}")
+            return 0
+
+    def _doc_filter(self, doc_id, modality=None):
+        """shared布局下按doc_id过滤；per_document布局下集合本身只含该文档，不需要过滤
+
+        给出 modality 时只检索该模态（image/merged）的数据点，同一文档先后以单页、拼接两种模式入库时
+        两种数据点共存于同一doc_id下，不按模态过滤会混在一起返回。没有modality字段的旧数据点仍然返回。
+        """
+        must = []
+        if self.layout != "per_document":
+            must.append(
+                qdrant_models.FieldCondition(
+                    key="doc_id",
+                    match=qdrant_models.MatchValue(
+                        value=doc_id,
+                    ),
                 )
             )
+        should = None
+        if modality is not None:
+            should = [
+                qdrant_models.FieldCondition(key="modality", match=qdrant_models.MatchValue(value=modality)),
+                qdrant_models.IsEmptyCondition(is_empty=qdrant_models.PayloadField(key="modality")),
+            ]
+        if not must and not should:
+            return None
+        return qdrant_models.Filter(must=must or None, should=should)
+
+    def make_point(self, point_id, multivector, payload, sparse_vector=None):
+        """按集合结构构造数据点
+
+        命名向量结构的集合同时写入多向量和它的均值池化向量，旧版集合只写入多向量。
+
+        Args:
+            point_id: 数据点ID
+            multivector: 形状为 (num_tokens, dim) 的多向量
+            payload: 负载
+            sparse_vector: BM25稀疏向量，集合带有稀疏向量时一并写入
+        """
+        multivector = np.asarray(multivector, dtype=np.float32)
+        collection_name = self.collection_for(payload["doc_id"], create=True)
+        if self._named_vectors[collection_name]:
+            vector = {
+                MULTIVECTOR_NAME: multivector.tolist(),
+                POOLED_VECTOR_NAME: multivector.mean(axis=0).tolist(),
+            }
+            if sparse_vector is not None and self._sparse_vectors[collection_name]:
+                vector[SPARSE_VECTOR_NAME] = sparse_vector
+        else:
+            vector = multivector.tolist()
+        return qdrant_models.PointStruct(id=point_id, vector=vector, payload=payload)
+
+    def migrate_quantization(self, collection_info=None, mode=VECTOR_QUANTIZATION, collection_name=None):
+        """将已有集合的量化配置迁移到指定模式
+
+        只更新集合配置，原始向量不变，Qdrant会在后台重建量化索引，不需要重新入库。
+        """
+        if not self.quantization_supported:
+            return False
+        collection_name = collection_name or self.collection_name
+        if collection_info is None:
+            collection_info = self.client.get_collection(collection_name=collection_name)
+        current = collection_info.config.quantization_config
+        target = build_quantization_config(mode)
+        if current == target:
+            return False
+
+        print(f"迁移集合 {collection_name} 的量化配置: {type(current).__name__} -> {mode}")
+        self.client.update_collection(
+            collection_name=collection_name,
+            quantization_config=target if target is not None else qdrant_models.Disabled.DISABLED,
+        )
+        return True
+
+    def _search_params(self):
+        return build_search_params() if self.quantization_supported else None
+
+    def _build_query(self, doc_id, query_vector, limit, score_threshold, candidates, payload_fields,
+                     sparse_vector=None, modality=None):
+        """构造单条检索请求
+
+        命名向量结构的集合采用两阶段检索：先用查询的均值池化向量在HNSW索引上召回
+        candidates 个候选，再只对候选做完整的MaxSim重排。
+        MaxSim得分是各查询token最大相似度之和，随查询长度变化，因此 score_threshold
+        按每个查询token的平均相似度解释，换算为 score_threshold * 查询token数 后交给Qdrant过滤。
+
+        给出 sparse_vector 且集合带有稀疏向量时做混合检索：多向量一路与BM25一路各召回
+        HYBRID_PREFETCH_LIMIT 个候选，用RRF融合排序（阈值只作用于多向量一路）。
+        """
+        collection_name = self.collection_for(doc_id)
+        named_vectors = self._named_vectors[collection_name]
+        query_filter = self._doc_filter(doc_id, modality)
+        prefetch = None
+        if named_vectors and candidates:
+            prefetch = qdrant_models.Prefetch(
+                query=np.asarray(query_vector, dtype=np.float32).mean(axis=0).tolist(),
+                using=POOLED_VECTOR_NAME,
+                limit=max(candidates, limit),
+                filter=query_filter,
+            )
+        dense_threshold = None if score_threshold is None else score_threshold * len(query_vector)
+        with_payload = payload_fields if payload_fields is not None else True
 
-    def search(self, doc_id, query_vector, limit=DEFAULT_LIMIT, score_threshold=DEFAULT_SCORE_THRESHOLD):
-        """搜索相似向量"""
+        if sparse_vector is not None and named_vectors and self._sparse_vectors[collection_name]:
+            fusion_limit = max(HYBRID_PREFETCH_LIMIT, limit)
+            request = qdrant_models.QueryRequest(
+                prefetch=[
+                    qdrant_models.Prefetch(
+                        query=query_vector,
+                        using=MULTIVECTOR_NAME,
+                        prefetch=prefetch,
+                        limit=fusion_limit,
+                        score_threshold=dense_threshold,
+                        params=self._search_params(),
+                        filter=query_filter,
+                    ),
+                    qdrant_models.Prefetch(
+                        query=sparse_vector,
+                        using=SPARSE_VECTOR_NAME,
+                        limit=fusion_limit,
+                        filter=query_filter,
+                    ),
+                ],
+                query=qdrant_models.FusionQuery(fusion=qdrant_models.Fusion.RRF),
+                limit=limit,
+                with_vector=False,
+                with_payload=with_payload,
+            )
+            return collection_name, request
+
+        request = qdrant_models.QueryRequest(
+            query=query_vector,
+            using=MULTIVECTOR_NAME if named_vectors else None,
+            prefetch=prefetch,
+            limit=limit,
+            score_threshold=dense_threshold,
+            params=self._search_params(),
+            filter=query_filter,
+            with_vector=False,
+            with_payload=with_payload,
+        )
+        return collection_name, request
+
+    def search(self, doc_id, query_vector, limit=DEFAULT_LIMIT, score_threshold=DEFAULT_SCORE_THRESHOLD,
+               candidates=PREFETCH_CANDIDATES, payload_fields=None, sparse_vector=None, modality=None):
+        """搜索相似向量
+
+        结果不返回向量，只返回 payload_fields 中的负载字段。
+
+        Args:
+            score_threshold: 每个查询token的平均相似度阈值，为None时不过滤
+            candidates: 第一阶段召回的候选数，为0或集合不支持时直接对全部数据做MaxSim
+            payload_fields: 需要返回的负载字段列表，为None时返回全部负载
+            sparse_vector: 查询的BM25稀疏向量，给出时与多向量结果做RRF融合
+            modality: 只检索负载中 modality 为该值的数据点（如图片集合中的 "image" 或 "merged"）
+        """
+        results = self.search_batch(doc_id, [query_vector], limit, score_threshold, candidates, payload_fields,
+                                    None if sparse_vector is None else [sparse_vector], modality)
+        return results[0] if results else None
+
+    def search_batch(self, doc_id, query_vectors, limit=DEFAULT_LIMIT, score_threshold=DEFAULT_SCORE_THRESHOLD,
+                     candidates=PREFETCH_CANDIDATES, payload_fields=None, sparse_vectors=None, modality=None):
+        """在同一文档中批量搜索多条查询，一次请求发给Qdrant
+
+        参数含义与 search 相同。
+
+        Returns:
+            list: 与 query_vectors 顺序一致的检索结果，出错时返回None
+        """
         try:
             start_time = time.time()
-            results = self.client.query_points(
-                collection_name=self.collection_name,
-                query=query_vector,
-                limit=limit,
-                query_filter=qdrant_models.Filter(
-                    must=[
-                        qdrant_models.FieldCondition(
-                            key="doc_id",
-                            match=qdrant_models.MatchValue(
-                                value=doc_id,
-                            ),
-                        )
-                    ]
-                ),
+            if self.collection_for(doc_id) is None:
+                print(f"[qdrant] 文档 {doc_id} 的集合不存在，返回空结果")
+                return [qdrant_models.QueryResponse(points=[]) for _ in query_vectors]
+            sparse_vectors = sparse_vectors or [None] * len(query_vectors)
+            requests = [
+                self._build_query(doc_id, query_vector, limit, score_threshold, candidates, payload_fields,
+                                  sparse_vector, modality)
+                for query_vector, sparse_vector in zip(query_vectors, sparse_vectors)
+            ]
+            collection_name = requests[0][0]
+            results = self.client.query_batch_points(
+                collection_name=collection_name,
+                requests=[request for _, request in requests],
+                timeout=QDRANT_TIMEOUT,
             )
-            search_time = time.time() - start_time
-            print(f"搜索完成，用时 {search_time:.3f} 秒")
-            print(results)
-            print(f"找到 {len(results.points)} 个结果")
+            self.last_search_stats = {
+                "collection": collection_name,
+                "doc_id": doc_id,
+                "queries": len(query_vectors),
+                "hits": [len(result.points) for result in results],
+                "limit": limit,
+                "candidates": candidates if requests[0][1].prefetch else 0,
+                "hybrid": isinstance(requests[0][1].query, qdrant_models.FusionQuery),
+                "time_ms": round((time.time() - start_time) * 1000, 1),
+            }
+            print(f"[qdrant] {self.last_search_stats}")
             return results
         except Exception as e:
             print(f"❌ 搜索时出错: {str(e)}")
             return None
         
     def delete_by_filter(self,doc_id,db_name):
-        # 定义过滤条件
+        if self.layout == "per_document":
+            # 文档独占集合，直接删除整个集合
+            collection_name = f"{db_name}_{doc_id}"
+            with self._collections_lock:
+                # 文档可能从未写入过数据点（如入库中途失败），集合不存在时跳过
+                if self.client.collection_exists(collection_name):
+                    self.client.delete_collection(collection_name=collection_name)
+                self._named_vectors.pop(collection_name, None)
+                self._sparse_vectors.pop(collection_name, None)
+            print("删除完成！")
+            return
 
+        # 定义过滤条件
         self.client.delete(
             collection_name=db_name,
             points_selector=qdrant_models.FilterSelector(
@@ -132,12 +525,16 @@ class QdrantManager:
         print("删除完成！")
 
     def save_points(self, points):
-        """保存向量点到数据库"""
+        """保存向量点到数据库（per_document布局下按负载中的doc_id分别写入各文档的集合）"""
         try:
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            grouped = {}
+            for point in points:
+                grouped.setdefault(self.collection_for(point.payload["doc_id"], create=True), []).append(point)
+            for collection_name, collection_points in grouped.items():
+                self.client.upsert(
+                    collection_name=collection_name,
+                    points=collection_points
+                )
             return True
         except Exception as e:
             print(f"保存到数据库时出错: {str(e)}")
@@ -1,9 +1,75 @@
+import math
 import torch
 from colpali_engine.models import ColQwen2, ColQwen2Processor
-from config.settings import MODEL_NAME, MODEL_CACHE_DIR
+from config.settings import MODEL_NAME, MODEL_CACHE_DIR, IMAGE_TOKEN_BUDGET, IMAGE_MAX_BATCH_SIZE, QUERY_BATCH_SIZE, \
+    COLQWEN2_CPU_BACKEND, CPU_NUM_THREADS
 from fastembed import LateInteractionTextEmbedding
 import numpy as np
 
+
+def load_colqwen2_model(backend, device, model_name=MODEL_NAME, cache_dir=MODEL_CACHE_DIR, proxies=None):
+    """按推理后端加载ColQwen2模型
+
+    Args:
+        backend: "bf16" 原始bfloat16权重；"fp32" 单精度；
+            "int8" 在fp32基础上对Linear层做动态int8量化（仅支持CPU）
+        device: "cuda"、"mps" 或 "cpu"
+        proxies: 下载模型时使用的代理，如 {"http": ..., "https": ...}，只作用于本次下载
+    """
+    if backend == "int8" and device != "cpu":
+        raise ValueError("int8动态量化只支持CPU推理")
+    model = ColQwen2.from_pretrained(
+        pretrained_model_name_or_path=model_name,
+        torch_dtype=torch.bfloat16 if backend == "bf16" else torch.float32,
+        device_map=device,
+        cache_dir=cache_dir,
+        proxies=proxies
+    )
+    model.eval()
+    if backend == "int8":
+        # 权重量化为int8，激活在推理时动态量化，query与图像两个塔都生效
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def encode_queries(model, processor, device, queries):
+    """对一批查询做前向传播，返回去掉补齐位置的 float32 numpy 多向量列表"""
+    with torch.no_grad():
+        batch_queries = processor.process_queries(queries).to(device)
+        query_embeddings = model(**batch_queries)
+    mask = batch_queries["attention_mask"].bool()
+    return [emb[m].cpu().float().numpy() for emb, m in zip(query_embeddings, mask)]
+
+
+def encode_images(model, processor, device, images):
+    """对一批图片做前向传播，返回去掉补齐位置的 float32 多向量列表"""
+    with torch.no_grad():
+        batch_images = processor.process_images(images).to(device)
+        image_embeddings = model(**batch_images)
+    mask = batch_images["attention_mask"].bool()
+    return [emb[m].cpu().float() for emb, m in zip(image_embeddings, mask)]
+
+
+def _prefetch_fastembed_model(model_class, model_name, cache_dir, proxies):
+    """经指定代理把fastembed模型文件下载到缓存目录
+
+    fastembed不支持传入代理，但加载时会先查找缓存目录中已有的模型文件，预先下载后即不再联网。
+    """
+    from huggingface_hub import snapshot_download
+    description = next(model for model in model_class.list_supported_models() if model["model"] == model_name)
+    hf_source = (description.get("sources") or {}).get("hf")
+    if not hf_source:
+        return
+    snapshot_download(
+        repo_id=hf_source,
+        cache_dir=cache_dir,
+        allow_patterns=["config.json", "tokenizer.json", "tokenizer_config.json", "special_tokens_map.json",
+                        "preprocessor_config.json", description["model_file"],
+                        *description.get("additional_files", [])],
+        proxies=proxies,
+    )
+
+
 class ColQwen2Embedder:
     """ColQwen2模型封装类（单例模式）"""
     _instance = None
@@ -14,37 +80,67 @@ class ColQwen2Embedder:
             cls._instance = super(ColQwen2Embedder, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, model_cache_dir=MODEL_CACHE_DIR):
+    def __init__(self, model_cache_dir=MODEL_CACHE_DIR, proxies=None):
+        """
+        Args:
+            model_cache_dir: 模型缓存目录
+            proxies: 下载模型时使用的代理，只作用于模型下载请求
+        """
         if not self._initialized:
+            self.proxies = proxies
             self.device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
             self.model_name = MODEL_NAME
             self.model_cache_dir = model_cache_dir
             self.model = None
             self.processor = None
+            # 动态批处理的token预算，显存不足时自动减半
+            self.token_budget = IMAGE_TOKEN_BUDGET
             self._init_model()
             self._initialized = True
 
     def _init_model(self):
         """初始化ColQwen2模型和处理器"""
         print("正在加载ColQwen2模型...")
-        self.model = ColQwen2.from_pretrained(
-            pretrained_model_name_or_path=self.model_name,
-            torch_dtype=torch.bfloat16,
-            device_map=self.device, 
-            cache_dir=self.model_cache_dir
-        )
+        # GPU上始终使用bfloat16，CPU上按配置选择推理后端
+        self.backend = COLQWEN2_CPU_BACKEND if self.device == "cpu" else "bf16"
+        if self.device == "cpu" and CPU_NUM_THREADS:
+            torch.set_num_threads(CPU_NUM_THREADS)
+        self.model = load_colqwen2_model(self.backend, self.device, self.model_name, self.model_cache_dir,
+                                         self.proxies)
         self.processor = ColQwen2Processor.from_pretrained(
             pretrained_model_name_or_path=self.model_name,
-            cache_dir=self.model_cache_dir
+            cache_dir=self.model_cache_dir,
+            proxies=self.proxies
+        )
+        print(f"✅ ColQwen2模型加载完成（{self.device}, {self.backend}）")
+
+    def cache_namespace(self):
+        """向量缓存的命名空间：模型名称及影响图片编码结果的设置"""
+        image_processor = self.processor.image_processor
+        return (
+            f"colqwen2|{self.model_name}|{self.backend}"
+            f"|min_pixels={getattr(image_processor, 'min_pixels', None)}"
+            f"|max_pixels={getattr(image_processor, 'max_pixels', None)}"
         )
-        print("✅ ColQwen2模型加载完成")
 
     def get_text_embedding(self, query):
         """获取文本的嵌入向量"""
-        with torch.no_grad():
-            text_embedding = self.processor.process_queries([query]).to(self.device)
-            text_embedding = self.model(**text_embedding)
-        return text_embedding[0].cpu().float().numpy().tolist()
+        return self.get_query_embeddings([query])[0].tolist()
+
+    def get_query_embeddings(self, queries, batch_size=QUERY_BATCH_SIZE):
+        """批量编码查询，每个批次一次前向传播
+
+        Args:
+            queries: 查询文本列表
+            batch_size: 单次前向传播的查询数
+
+        Returns:
+            list: 与输入顺序一致的 float32 numpy 多向量列表，已按attention_mask去掉补齐位置
+        """
+        results = []
+        for start in range(0, len(queries), batch_size):
+            results.extend(encode_queries(self.model, self.processor, self.device, queries[start:start + batch_size]))
+        return results
 
     def get_image_embeddings(self, images):
         """获取图片的嵌入向量"""
@@ -53,6 +149,87 @@ class ColQwen2Embedder:
             image_embeddings = self.model(**batch_images)
         return image_embeddings 
 
+    def estimate_image_tokens(self, image):
+        """估算单张图片经processor缩放后的视觉token数
+
+        与Qwen2-VL的smart_resize一致：边长对齐到 patch_size * merge_size 的整数倍，
+        总像素限制在 [min_pixels, max_pixels] 区间内。
+        """
+        image_processor = self.processor.image_processor
+        factor = getattr(image_processor, "patch_size", 14) * getattr(image_processor, "merge_size", 2)
+        min_pixels = getattr(image_processor, "min_pixels", None) or factor * factor * 4
+        max_pixels = getattr(image_processor, "max_pixels", None) or 768 * factor * factor
+
+        height = max(factor, round(image.height / factor) * factor)
+        width = max(factor, round(image.width / factor) * factor)
+        if height * width > max_pixels:
+            beta = math.sqrt(image.height * image.width / max_pixels)
+            height = max(factor, math.floor(image.height / beta / factor) * factor)
+            width = max(factor, math.floor(image.width / beta / factor) * factor)
+        elif height * width < min_pixels:
+            beta = math.sqrt(min_pixels / (image.height * image.width))
+            height = math.ceil(image.height * beta / factor) * factor
+            width = math.ceil(image.width * beta / factor) * factor
+        return (height // factor) * (width // factor)
+
+    def _plan_batches(self, token_counts):
+        """按token数分组：相近大小的图片放在同一批，批内补齐后的token总数不超过预算"""
+        order = sorted(range(len(token_counts)), key=lambda idx: token_counts[idx])
+        batches, batch, batch_max = [], [], 0
+        for idx in order:
+            new_max = max(batch_max, token_counts[idx])
+            if batch and (new_max * (len(batch) + 1) > self.token_budget or len(batch) >= IMAGE_MAX_BATCH_SIZE):
+                batches.append(batch)
+                batch, new_max = [], token_counts[idx]
+            batch.append(idx)
+            batch_max = new_max
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _is_oom(e):
+        if isinstance(e, getattr(torch.cuda, "OutOfMemoryError", ())):
+            return True
+        return isinstance(e, RuntimeError) and "out of memory" in str(e).lower()
+
+    def _embed_batch(self, images):
+        """对一批图片做前向传播，按attention_mask去掉补齐位置，返回每张图片各自的多向量"""
+        return encode_images(self.model, self.processor, self.device, images)
+
+    def embed_images(self, images):
+        """按token预算动态分批生成图片向量
+
+        显存不足时将预算减半并拆分当前批次重试，预算在实例上保留，
+        后续调用直接使用回退后的预算。
+
+        Args:
+            images: PIL图片列表
+
+        Returns:
+            list: 与输入顺序一致的多向量列表，每个元素形状为 (num_tokens, VECTOR_SIZE)
+        """
+        results = [None] * len(images)
+        pending = self._plan_batches([self.estimate_image_tokens(image) for image in images])
+
+        while pending:
+            batch = pending.pop(0)
+            try:
+                embeddings = self._embed_batch([images[idx] for idx in batch])
+            except Exception as e:
+                if not self._is_oom(e) or len(batch) == 1:
+                    raise
+                if self.device == "cuda":
+                    torch.cuda.empty_cache()
+                self.token_budget = max(1, self.token_budget // 2)
+                print(f"⚠️ 显存不足，批大小 {len(batch)} 回退，token预算降为 {self.token_budget}")
+                half = len(batch) // 2
+                pending[:0] = [batch[:half], batch[half:]]
+                continue
+            for idx, embedding in zip(batch, embeddings):
+                results[idx] = embedding
+        return results
+
 
 class ColBertEmbedder:
     """ColBERT模型封装类（单例模式）
@@ -73,17 +250,20 @@ class ColBertEmbedder:
             cls._instance = super(ColBertEmbedder, cls).__new__(cls)
         return cls._instance
     
-    def __init__(self, model_name="colbert-ir/colbertv2.0", model_cache_dir=MODEL_CACHE_DIR):
+    def __init__(self, model_name="colbert-ir/colbertv2.0", model_cache_dir=MODEL_CACHE_DIR, proxies=None):
         """初始化ColBERT嵌入器
         
         Args:
             model_name: ColBERT模型名称，默认为"colbert-ir/colbertv2.0"
             model_cache_dir: 模型缓存目录
+            proxies: 下载模型时使用的代理，只作用于模型下载请求
         """
         if not self._initialized:
             print("正在加载ColBERT模型...")
             self.model_name = model_name
             self.model_cache_dir = model_cache_dir
+            if proxies:
+                _prefetch_fastembed_model(LateInteractionTextEmbedding, model_name, model_cache_dir, proxies)
             self.embedding_model = LateInteractionTextEmbedding(
                 model_name, 
                 cache_dir=model_cache_dir
@@ -91,6 +271,10 @@ class ColBertEmbedder:
             self._initialized = True
             print(f"✅ ColBERT模型 {model_name} 加载完成")
     
+    def cache_namespace(self):
+        """向量缓存的命名空间"""
+        return f"colbert|{self.model_name}"
+
     def get_text_embeddings(self, texts):
         """获取多个文本的嵌入向量矩阵
         
@@ -117,4 +301,21 @@ class ColBertEmbedder:
             numpy.ndarray形式的嵌入向量矩阵
         """
         return next(self.embedding_model.embed([text]))
+
+    def get_query_embeddings(self, queries, batch_size=QUERY_BATCH_SIZE):
+        """批量编码查询
+
+        与 get_text_embedding 使用相同的编码方式，保证与已有索引的检索结果一致。
+
+        Args:
+            queries: 查询文本列表
+            batch_size: 单次推理的查询数
+
+        Returns:
+            list: 与输入顺序一致的 float32 numpy 多向量列表
+        """
+        return [
+            np.asarray(embedding, dtype=np.float32)
+            for embedding in self.embedding_model.embed(list(queries), batch_size=batch_size)
+        ]
     
\ No newline at end of file
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from config.settings import EMBEDDING_CACHE_DIR
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """文件内容哈希（分块读取，不会一次性载入大文件）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_content_hash(text):
+    """文本块的内容哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def image_content_hash(image):
+    """渲染后页面图片的内容哈希（基于像素字节，与图片文件格式无关）"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}|{image.width}x{image.height}|".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """按内容寻址的持久化向量缓存
+
+    缓存键为 sha256(命名空间 + 内容哈希)，命名空间由模型名称和影响输出的设置组成，
+    更换模型或设置后旧缓存自然失效。每个多向量以 .npy 文件存放在
+    <cache_dir>/<命名空间哈希>/<键前两位>/<键>.npy 下，写入采用临时文件+重命名，
+    多个进程同时写入同一个键也是安全的。
+    """
+
+    def __init__(self, namespace, cache_dir=EMBEDDING_CACHE_DIR):
+        """
+        Args:
+            namespace: 缓存命名空间，如 "vidore/colqwen2-v0.1|max_pixels=..."
+            cache_dir: 缓存根目录
+        """
+        self.namespace = namespace
+        namespace_hash = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:16]
+        self.cache_dir = os.path.join(cache_dir, namespace_hash)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        """读取缓存的多向量，不存在时返回None"""
+        path = self._path(key)
+        try:
+            embedding = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            embedding = None
+        with self._lock:
+            if embedding is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return embedding
+
+    def put(self, key, embedding):
+        """写入多向量（float32）"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(embedding, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+
+def embed_with_cache(cache, keys, items, embed_fn):
+    """先查缓存，只对未命中的元素调用模型
+
+    Args:
+        cache: EmbeddingCache，为None时直接调用模型
+        keys: 与items一一对应的内容哈希
+        items: 待编码的文本或图片
+        embed_fn: 批量编码函数，输入元素列表，返回同样顺序的多向量列表
+
+    Returns:
+        list: 与items顺序一致的 float32 numpy 多向量列表
+    """
+    results = [cache.get(key) if cache else None for key in keys]
+    missing = [idx for idx, embedding in enumerate(results) if embedding is None]
+
+    if missing:
+        embeddings = embed_fn([items[idx] for idx in missing])
+        for idx, embedding in zip(missing, embeddings):
+            embedding = np.asarray(embedding, dtype=np.float32)
+            results[idx] = embedding
+            if cache:
+                cache.put(keys[idx], embedding)
+    return results
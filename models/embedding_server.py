@@ -0,0 +1,208 @@
+import argparse
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from config.settings import EMBED_SERVER_ADDRESS, EMBED_SERVER_AUTHKEY, EMBED_SERVER_MAX_BATCH, \
+    EMBED_SERVER_MAX_WAIT_MS
+
+# 每个模型支持的编码操作及其对应的embedder方法
+OPERATIONS = {
+    "colqwen2": {"query": "get_query_embeddings", "image": "embed_images"},
+    "colbert": {"query": "get_query_embeddings", "text": "get_text_embeddings"},
+}
+
+
+def _load_embedder(model):
+    from models.embedder import ColQwen2Embedder, ColBertEmbedder
+    return ColQwen2Embedder() if model == "colqwen2" else ColBertEmbedder()
+
+
+class _MicroBatcher:
+    """单个 (模型, 操作) 的微批处理队列
+
+    不同连接的请求进入同一个队列，工作线程取出第一个请求后最多再等待 max_wait_ms，
+    把期间到达的请求合并成一批（不超过 max_batch 个元素）一次编码，再按请求拆分结果。
+    """
+
+    def __init__(self, name, encode_fn, max_batch=EMBED_SERVER_MAX_BATCH, max_wait_ms=EMBED_SERVER_MAX_WAIT_MS):
+        self.name = name
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True).start()
+
+    def submit(self, items, reply):
+        """提交一个请求，编码完成后调用 reply(embeddings) 或 reply(exception)"""
+        self.requests.put((items, reply))
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for request_items, _ in batch for item in request_items]
+            try:
+                embeddings = [np.asarray(e, dtype=np.float32) for e in self.encode_fn(items)]
+            except Exception as e:
+                for _, reply in batch:
+                    reply(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+
+            offset = 0
+            for request_items, reply in batch:
+                reply(embeddings[offset:offset + len(request_items)])
+                offset += len(request_items)
+
+
+class EmbeddingServer:
+    """本地向量编码服务
+
+    在独立进程中加载模型，通过 Unix socket 或 localhost TCP 接收编码请求。
+    请求格式为 (request_id, model, op, items)，响应为 (request_id, ok, result)；
+    同一连接上的请求可以并发，响应按完成顺序返回。
+    """
+
+    def __init__(self, models=("colqwen2", "colbert"), address=EMBED_SERVER_ADDRESS, authkey=EMBED_SERVER_AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self.embedders = {}
+        self.batchers = {}
+        for model in models:
+            self.embedders[model] = _load_embedder(model)
+            for op, method in OPERATIONS[model].items():
+                self.batchers[(model, op)] = _MicroBatcher(f"{model}-{op}", getattr(self.embedders[model], method))
+
+    def _handle_request(self, conn, send_lock, request):
+        request_id, model, op, items = request
+
+        def reply(result):
+            ok = not isinstance(result, Exception)
+            with send_lock:
+                conn.send((request_id, ok, result if ok else f"{type(result).__name__}: {result}"))
+
+        if op == "namespace" and model in self.embedders:
+            reply(self.embedders[model].cache_namespace())
+        elif (model, op) in self.batchers:
+            self.batchers[(model, op)].submit(items, reply)
+        else:
+            reply(ValueError(f"不支持的编码请求: {model}/{op}"))
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+        try:
+            while True:
+                self._handle_request(conn, send_lock, conn.recv())
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"✅ 向量编码服务已启动: {self.address}，模型: {', '.join(self.embedders)}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class RemoteEmbedder:
+    """编码服务的客户端，接口与 ColQwen2Embedder / ColBertEmbedder 一致
+
+    一个连接由多个线程共享：请求带上编号发送，后台线程接收响应并分发给对应的 Future，
+    因此同一进程内的并发请求也能在服务端被合并为一个微批次。
+    """
+
+    def __init__(self, model, address=EMBED_SERVER_ADDRESS, authkey=EMBED_SERVER_AUTHKEY):
+        if model not in OPERATIONS:
+            raise ValueError(f"不支持的模型: {model}")
+        self.model = model
+        self.conn = Client(address, authkey=authkey)
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        threading.Thread(target=self._receive, name=f"embed-client-{model}", daemon=True).start()
+        self._namespace = self._call("namespace", None)
+
+    def _receive(self):
+        try:
+            while True:
+                request_id, ok, result = self.conn.recv()
+                with self._pending_lock:
+                    future = self._pending.pop(request_id)
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(f"编码服务出错: {result}"))
+        except (EOFError, OSError) as e:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ConnectionError(f"与编码服务的连接已断开: {str(e)}"))
+
+    def _call(self, op, items):
+        future = Future()
+        request_id = next(self._ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+        with self._send_lock:
+            self.conn.send((request_id, self.model, op, items))
+        return future.result()
+
+    def cache_namespace(self):
+        return self._namespace
+
+    def get_query_embeddings(self, queries, batch_size=None):
+        return self._call("query", list(queries))
+
+    def get_text_embedding(self, query):
+        embedding = self.get_query_embeddings([query])[0]
+        # 与 ColQwen2Embedder.get_text_embedding 的返回类型保持一致
+        return embedding.tolist() if self.model == "colqwen2" else embedding
+
+    def get_text_embeddings(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        return self._call("text", list(texts))
+
+    def embed_images(self, images):
+        return self._call("image", list(images))
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动本地向量编码服务")
+    parser.add_argument("--models", default="colqwen2,colbert", help="逗号分隔的模型列表")
+    args = parser.parse_args()
+
+    EmbeddingServer(models=args.models.split(",")).serve_forever()
@@ -0,0 +1,148 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models as qdrant_models
+
+from config.settings import VECTOR_SIZE, MULTIVECTOR_NAME, POOLED_VECTOR_NAME
+from models.database import PAYLOAD_INDEXES, build_vectors_config
+
+
+def random_multivector(rng, num_tokens):
+    """随机生成逐token归一化的多向量，供各检索基准测试使用"""
+    vectors = rng.standard_normal((num_tokens, VECTOR_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _make_point(point_id, doc_id, page_num, multivector):
+    return qdrant_models.PointStruct(
+        id=point_id,
+        vector={
+            MULTIVECTOR_NAME: multivector.tolist(),
+            POOLED_VECTOR_NAME: multivector.mean(axis=0).tolist(),
+        },
+        payload={"doc_id": doc_id, "pdf_filename": f"{doc_id}.pdf", "page_num": page_num},
+    )
+
+
+def _doc_filter(doc_id):
+    return qdrant_models.Filter(
+        must=[qdrant_models.FieldCondition(key="doc_id", match=qdrant_models.MatchValue(value=doc_id))]
+    )
+
+
+class _Layout:
+    """一种集合布局：负责建表、写入和按文档检索"""
+
+    def __init__(self, name, client, indexed=False, per_document=False):
+        self.name = name
+        self.client = client
+        self.indexed = indexed
+        self.per_document = per_document
+
+    def collection(self, doc_id):
+        return f"bench_{self.name}_{doc_id}" if self.per_document else f"bench_{self.name}"
+
+    def create(self, doc_ids):
+        names = {self.collection(doc_id) for doc_id in doc_ids}
+        for name in names:
+            self.client.create_collection(collection_name=name, vectors_config=build_vectors_config())
+            if self.indexed:
+                for field_name, field_schema in PAYLOAD_INDEXES.items():
+                    self.client.create_payload_index(
+                        collection_name=name, field_name=field_name, field_schema=field_schema
+                    )
+
+    def upsert(self, doc_id, points):
+        self.client.upsert(collection_name=self.collection(doc_id), points=points)
+
+    def search(self, doc_id, query, limit, candidates):
+        query_filter = None if self.per_document else _doc_filter(doc_id)
+        return self.client.query_points(
+            collection_name=self.collection(doc_id),
+            prefetch=qdrant_models.Prefetch(
+                query=query.mean(axis=0).tolist(), using=POOLED_VECTOR_NAME, limit=candidates, filter=query_filter
+            ),
+            query=query.tolist(),
+            using=MULTIVECTOR_NAME,
+            limit=limit,
+            query_filter=query_filter,
+            with_payload=False,
+        )
+
+
+def run_benchmark(client, num_docs, pages_per_doc, tokens_per_page, num_queries, limit=5, candidates=20,
+                  layouts=("shared", "shared_indexed", "per_document"), seed=0):
+    """在同一批随机数据上比较不同集合布局的写入耗时与按文档过滤检索的延迟
+
+    Returns:
+        list[dict]: 每种布局的写入耗时、平均/P95检索延迟（毫秒）
+    """
+    rng = np.random.default_rng(seed)
+    doc_ids = [f"doc{i:06d}" for i in range(num_docs)]
+    factories = {
+        "shared": lambda: _Layout("shared", client),
+        "shared_indexed": lambda: _Layout("shared_indexed", client, indexed=True),
+        "per_document": lambda: _Layout("per_document", client, per_document=True),
+    }
+
+    reports = []
+    for layout in [factories[name]() for name in layouts]:
+        layout.create(doc_ids)
+        start_time = time.time()
+        point_id = 0
+        for doc_id in doc_ids:
+            points = []
+            for page_num in range(1, pages_per_doc + 1):
+                points.append(_make_point(point_id, doc_id, page_num, random_multivector(rng, tokens_per_page)))
+                point_id += 1
+            layout.upsert(doc_id, points)
+        ingest_time = time.time() - start_time
+
+        latencies = []
+        for doc_id in rng.choice(doc_ids, size=num_queries):
+            query = random_multivector(rng, 16)
+            start_time = time.time()
+            layout.search(doc_id, query, limit, candidates)
+            latencies.append((time.time() - start_time) * 1000)
+
+        reports.append({
+            "layout": layout.name,
+            "points": point_id,
+            "ingest_s": round(ingest_time, 2),
+            "mean_ms": round(float(np.mean(latencies)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        })
+        print(reports[-1])
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较共用集合、带租户索引的共用集合与每文档一个集合三种布局的检索延迟")
+    parser.add_argument("--url", default=None, help="Qdrant服务地址（如 http://localhost:6333），不指定时使用临时本地存储")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--tokens", type=int, default=32, help="每页的向量数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--layouts", default="shared,shared_indexed,per_document")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    if args.url:
+        client = QdrantClient(url=args.url)
+    else:
+        # 本地模式不使用负载索引，结果只能作为参考
+        tmp_dir = tempfile.mkdtemp(prefix="qdrant_bench_")
+        client = QdrantClient(path=tmp_dir)
+    try:
+        run_benchmark(client, args.docs, args.pages, args.tokens, args.queries, layouts=args.layouts.split(","))
+    finally:
+        if args.url:
+            for collection in client.get_collections().collections:
+                if collection.name.startswith("bench_"):
+                    client.delete_collection(collection.name)
+        client.close()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,97 @@
+import argparse
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient, models as qdrant_models
+
+from config.settings import MULTIVECTOR_NAME, POOLED_VECTOR_NAME
+from models.database import build_vectors_config
+from models.layout_benchmark import random_multivector
+from models.maxsim_index import MaxSimIndex
+
+
+def _latency_report(name, latencies):
+    return {
+        "backend": name,
+        "mean_ms": round(float(np.mean(latencies)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+def run_benchmark(client, num_pages, tokens_per_page, query_tokens, num_queries, limit=5, seed=0):
+    """在同一份随机数据上比较Qdrant多向量检索与本地NumPy MaxSim索引
+
+    Qdrant一侧只比较单阶段MaxSim（不做池化向量预召回），两边的排序应当一致，
+    差异只来自float16存储带来的精度损失。
+
+    Returns:
+        list[dict]: 两个后端的平均/P95检索延迟（毫秒），以及top-k一致率
+    """
+    rng = np.random.default_rng(seed)
+    collection_name = f"maxsim_bench_{uuid.uuid4().hex[:8]}"
+    tmp_dir = tempfile.mkdtemp(prefix="maxsim_bench_")
+    client.create_collection(collection_name=collection_name, vectors_config=build_vectors_config())
+    index = MaxSimIndex(tmp_dir, "bench")
+    try:
+        pages = [random_multivector(rng, tokens_per_page) for _ in range(num_pages)]
+        ids = [str(uuid.uuid4()) for _ in pages]
+        payloads = [{"page_num": i + 1} for i in range(num_pages)]
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                qdrant_models.PointStruct(
+                    id=point_id,
+                    vector={MULTIVECTOR_NAME: page.tolist(), POOLED_VECTOR_NAME: page.mean(axis=0).tolist()},
+                    payload=payload,
+                )
+                for point_id, page, payload in zip(ids, pages, payloads)
+            ],
+        )
+        index.add(ids, pages, payloads)
+
+        qdrant_latencies, numpy_latencies, agreements = [], [], []
+        for _ in range(num_queries):
+            query = random_multivector(rng, query_tokens)
+
+            start_time = time.time()
+            qdrant_result = client.query_points(
+                collection_name=collection_name, query=query.tolist(), using=MULTIVECTOR_NAME,
+                limit=limit, with_payload=False, with_vectors=False,
+            )
+            qdrant_latencies.append((time.time() - start_time) * 1000)
+
+            start_time = time.time()
+            numpy_result = index.search(query, limit=limit)
+            numpy_latencies.append((time.time() - start_time) * 1000)
+
+            qdrant_ids = {str(point.id) for point in qdrant_result.points}
+            numpy_ids = {str(point.id) for point in numpy_result.points}
+            agreements.append(len(qdrant_ids & numpy_ids) / max(len(qdrant_ids), 1))
+
+        reports = [_latency_report("qdrant", qdrant_latencies), _latency_report("numpy", numpy_latencies)]
+        reports[1][f"top{limit}_agreement"] = round(float(np.mean(agreements)), 3)
+        for report in reports:
+            print(report)
+        return reports
+    finally:
+        client.delete_collection(collection_name)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较Qdrant与本地NumPy MaxSim索引在单文档检索上的延迟")
+    parser.add_argument("--url", default=None, help="Qdrant服务地址，不指定时使用内存模式")
+    parser.add_argument("--pages", type=int, default=50, help="文档页数（或文本块数）")
+    parser.add_argument("--tokens", type=int, default=768, help="每页的向量数")
+    parser.add_argument("--query-tokens", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(location=":memory:")
+    try:
+        run_benchmark(client, args.pages, args.tokens, args.query_tokens, args.queries)
+    finally:
+        client.close()
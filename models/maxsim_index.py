@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+
+import numpy as np
+# qdrant_client.models 中的 QueryResponse 会被 fastembed 的同名类覆盖，检索结果结构须从 http.models 导入
+from qdrant_client.http import models as qdrant_models
+
+from config.settings import VECTOR_SIZE, MAXSIM_CHUNK_TOKENS
+
+
+class MaxSimIndex:
+    """单个文档、单个模态的本地多向量索引（内存映射 + NumPy MaxSim）
+
+    所有条目的多向量以 float16 连续存放在 <name>.f16 中，每写入一批就在 <name>.jsonl 里追加
+    一行条目信息（数据点ID、起始token位置、token数、负载）。检索时把整块向量内存映射进来，
+    按条目边界分块转为float32与查询做矩阵乘法，再按条目分段取最大值求和，得到每个条目的MaxSim得分。
+
+    只追加写入，入库进行中也可以检索已写入的部分；文件在另一个线程追加后会在下次检索时自动重新加载。
+    """
+
+    def __init__(self, folder, name, dim=VECTOR_SIZE, chunk_tokens=MAXSIM_CHUNK_TOKENS):
+        """
+        Args:
+            folder: 索引所在目录（文档输出目录下）
+            name: 索引名称，通常为模态名（text/image/merged）
+            dim: 向量维度
+            chunk_tokens: 每次转为float32计算的最大token数（单个条目超过时按条目计算）
+        """
+        self.vectors_path = os.path.join(folder, f"{name}.f16")
+        self.entries_path = os.path.join(folder, f"{name}.jsonl")
+        self.dim = dim
+        self.chunk_tokens = chunk_tokens
+        self._lock = threading.Lock()
+        self._loaded_size = None
+        self._vectors = None
+        self._starts = None
+        self._ids = []
+        self._payloads = []
+        os.makedirs(folder, exist_ok=True)
+
+    def add(self, point_ids, multivectors, payloads):
+        """追加一批条目（先写向量再写条目信息，中途中断不会留下指向不完整数据的条目）"""
+        with self._lock:
+            with open(self.vectors_path, "ab") as f:
+                start = f.tell() // (2 * self.dim)
+                lines = []
+                for point_id, multivector, payload in zip(point_ids, multivectors, payloads):
+                    multivector = np.asarray(multivector, dtype=np.float16).reshape(-1, self.dim)
+                    f.write(multivector.tobytes())
+                    lines.append(json.dumps({
+                        "id": str(point_id), "start": start, "length": len(multivector), "payload": payload
+                    }, ensure_ascii=False))
+                    start += len(multivector)
+            with open(self.entries_path, "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in lines))
+
+    def __len__(self):
+        self._refresh()
+        return len(self._ids)
+
+    def _refresh(self):
+        """条目文件有变化时重新加载：同一ID只保留最后一次写入，并检查向量是否紧密排列"""
+        size = os.path.getsize(self.entries_path) if os.path.exists(self.entries_path) else 0
+        if size == self._loaded_size:
+            return
+        with self._lock:
+            entries = {}
+            if size:
+                with open(self.entries_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # 中断时写了一半的行
+                        entries[entry["id"]] = entry
+            entries = sorted(entries.values(), key=lambda entry: entry["start"])
+
+            vectors = np.zeros((0, self.dim), dtype=np.float16)
+            starts = []
+            if entries:
+                num_tokens = os.path.getsize(self.vectors_path) // (2 * self.dim)
+                vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(num_tokens, self.dim))
+                packed = all(a["start"] + a["length"] == b["start"] for a, b in zip(entries, entries[1:]))
+                if packed:
+                    first = entries[0]["start"]
+                    vectors = vectors[first:entries[-1]["start"] + entries[-1]["length"]]
+                    starts = [entry["start"] - first for entry in entries]
+                else:
+                    # 重复写入或中断留下的空洞：拷贝成紧密排列的数组（只在内存中，文件保持不变）
+                    vectors = np.concatenate([vectors[e["start"]:e["start"] + e["length"]] for e in entries])
+                    starts = np.cumsum([0] + [entry["length"] for entry in entries[:-1]])
+
+            self._vectors = vectors
+            self._starts = np.asarray(starts, dtype=np.int64)
+            self._ids = [entry["id"] for entry in entries]
+            self._payloads = [entry["payload"] for entry in entries]
+            self._loaded_size = size
+
+    def scores(self, query_vector):
+        """计算查询与所有条目的MaxSim得分
+
+        Returns:
+            numpy.ndarray: 与条目顺序一致的得分
+        """
+        self._refresh()
+        if not self._ids:
+            return np.zeros(0, dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        starts = self._starts
+        ends = np.append(starts[1:], len(self._vectors))
+        scores = np.empty(len(starts), dtype=np.float32)
+        first = 0
+        while first < len(starts):
+            # 从first起取token总数不超过chunk_tokens的连续条目（至少一个），只把这一块转为float32
+            last = max(first + 1, int(np.searchsorted(ends, starts[first] + self.chunk_tokens, side="right")))
+            begin, end = starts[first], ends[last - 1]
+            similarities = np.asarray(self._vectors[begin:end], dtype=np.float32) @ query.T  # (块内token数, 查询token数)
+            scores[first:last] = np.maximum.reduceat(similarities, starts[first:last] - begin, axis=0).sum(axis=1)
+            first = last
+        return scores
+
+    def search(self, query_vector, limit=5, score_threshold=None, payload_fields=None):
+        """检索得分最高的条目，返回与 QdrantManager.search 相同结构的结果
+
+        Args:
+            score_threshold: 每个查询token的平均相似度阈值（与 QdrantManager.search 含义一致）
+            payload_fields: 需要返回的负载字段，为None时返回全部负载
+        """
+        scores = self.scores(query_vector)
+        order = np.argsort(-scores)[:limit]
+        if score_threshold is not None:
+            order = [i for i in order if scores[i] >= score_threshold * len(query_vector)]
+
+        points = []
+        for i in order:
+            payload = self._payloads[i]
+            if payload_fields is not None:
+                payload = {key: payload[key] for key in payload_fields if key in payload}
+            points.append(qdrant_models.ScoredPoint(id=self._ids[i], version=0, score=float(scores[i]), payload=payload))
+        return qdrant_models.QueryResponse(points=points)
@@ -0,0 +1,93 @@
+import argparse
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+from PIL import Image
+from colpali_engine.models import ColQwen2Processor
+
+from config.settings import MODEL_NAME, MODEL_CACHE_DIR, COLQWEN2_CPU_BACKEND, PARITY_MIN_COSINE
+from models.embedder import load_colqwen2_model, encode_queries, encode_images
+from models.pooling import maxsim_matrix
+
+
+def _token_cosine(reference, candidate):
+    """两组逐token对应的多向量之间的平均余弦相似度"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return float(np.mean(np.sum(reference * candidate, axis=1)))
+
+
+def _encode(backend, processor, queries, images):
+    model = load_colqwen2_model(backend, "cpu", MODEL_NAME, MODEL_CACHE_DIR)
+    start_time = time.time()
+    query_embeddings = [encode_queries(model, processor, "cpu", [query])[0] for query in queries]
+    query_latency = (time.time() - start_time) / max(len(queries), 1)
+    image_embeddings = [encode_images(model, processor, "cpu", [image])[0].numpy() for image in images]
+    del model
+    return query_embeddings, image_embeddings, query_latency
+
+
+def check_parity(queries, images, backend=COLQWEN2_CPU_BACKEND, reference_backend="fp32"):
+    """比较CPU推理后端与参考后端的向量一致性和查询延迟
+
+    Args:
+        queries: 查询文本列表
+        images: PIL页面图片列表
+        backend: 待检查的后端（如 "int8"）
+        reference_backend: 参考后端，默认fp32
+
+    Returns:
+        dict: 逐token余弦相似度、MaxSim排序一致率、得分相对误差、单条查询延迟及是否通过
+    """
+    processor = ColQwen2Processor.from_pretrained(MODEL_NAME, cache_dir=MODEL_CACHE_DIR)
+    ref_queries, ref_images, ref_latency = _encode(reference_backend, processor, queries, images)
+    test_queries, test_images, test_latency = _encode(backend, processor, queries, images)
+
+    query_cosines = [_token_cosine(r, t) for r, t in zip(ref_queries, test_queries)]
+    image_cosines = [_token_cosine(r, t) for r, t in zip(ref_images, test_images)]
+
+    report = {
+        "backend": backend,
+        "reference_backend": reference_backend,
+        "query_cosine_mean": float(np.mean(query_cosines)),
+        "query_cosine_min": float(np.min(query_cosines)),
+        "image_cosine_mean": float(np.mean(image_cosines)) if image_cosines else None,
+        "image_cosine_min": float(np.min(image_cosines)) if image_cosines else None,
+        "reference_query_latency": ref_latency,
+        "query_latency": test_latency,
+    }
+    if images:
+        ref_scores = maxsim_matrix(ref_queries, ref_images)
+        test_scores = maxsim_matrix(test_queries, test_images)
+        report["top1_agreement"] = float(np.mean(ref_scores.argmax(axis=1) == test_scores.argmax(axis=1)))
+        report["score_relative_error"] = float(np.mean(np.abs(test_scores - ref_scores) / np.abs(ref_scores)))
+
+    min_cosine = min(report["query_cosine_min"], report["image_cosine_min"] or 1.0)
+    report["passed"] = min_cosine >= PARITY_MIN_COSINE
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查ColQwen2 CPU推理后端与参考向量的一致性")
+    parser.add_argument("--backend", default=COLQWEN2_CPU_BACKEND, choices=["bf16", "fp32", "int8"])
+    parser.add_argument("--reference", default="fp32", choices=["bf16", "fp32", "int8"])
+    parser.add_argument("--questions", default="data.csv", help="包含question列的CSV文件")
+    parser.add_argument("--num-queries", type=int, default=20)
+    parser.add_argument("--images", default=None, help="页面图片文件夹（可选）")
+    parser.add_argument("--num-images", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [row["question"] for row in csv.DictReader(f)][:args.num_queries]
+    pages = []
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, "*.*")))[:args.num_images]
+        pages = [Image.open(path).convert("RGB") for path in paths]
+
+    result = check_parity(questions, pages, backend=args.backend, reference_backend=args.reference)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    print("✅ 一致性检查通过" if result["passed"] else "❌ 一致性检查未通过")
@@ -0,0 +1,103 @@
+import argparse
+import csv
+import glob
+import math
+import os
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from config.settings import IMAGE_POOL_FACTOR
+
+
+def pool_multivector(embedding, pool_factor=IMAGE_POOL_FACTOR):
+    """对单页的patch向量做层次聚类池化
+
+    用Ward层次聚类把相似的patch向量归为 ceil(n / pool_factor) 簇，
+    每簇取均值并重新归一化，保持与未池化向量相同的余弦尺度。
+
+    Args:
+        embedding: 形状为 (num_tokens, dim) 的多向量
+        pool_factor: 池化倍数，<=1 时原样返回
+
+    Returns:
+        numpy.ndarray: 形状为 (num_clusters, dim) 的 float32 多向量
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    num_clusters = max(1, math.ceil(len(embedding) / pool_factor)) if pool_factor > 1 else len(embedding)
+    if num_clusters >= len(embedding):
+        return embedding
+
+    normalized = embedding / np.maximum(np.linalg.norm(embedding, axis=1, keepdims=True), 1e-12)
+    labels = fcluster(linkage(normalized, method="ward"), t=num_clusters, criterion="maxclust")
+
+    pooled = np.stack([embedding[labels == label].mean(axis=0) for label in np.unique(labels)])
+    pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled.astype(np.float32)
+
+
+def maxsim_matrix(query_embeddings, page_embeddings):
+    """查询 × 页面的MaxSim得分矩阵"""
+    return np.array([
+        [float(np.max(query @ page.T, axis=1).sum()) for page in page_embeddings]
+        for query in query_embeddings
+    ])
+
+
+def evaluate_pooling(query_embeddings, page_embeddings, pool_factor, k=5):
+    """评估池化对检索质量与存储的影响（以未池化索引的检索结果为基准）
+
+    Args:
+        query_embeddings: 查询多向量列表
+        page_embeddings: 未池化的页面多向量列表
+        pool_factor: 池化倍数
+        k: 计算召回率的top-k
+
+    Returns:
+        dict: recall@k（池化后top-k对未池化top-k的覆盖率）、top1一致率、向量数压缩比
+    """
+    pooled_pages = [pool_multivector(page, pool_factor) for page in page_embeddings]
+    k = min(k, len(page_embeddings))
+
+    recalls, top1_matches = [], []
+    for base_scores, pooled_scores in zip(maxsim_matrix(query_embeddings, page_embeddings),
+                                          maxsim_matrix(query_embeddings, pooled_pages)):
+        base_top = set(np.argsort(-base_scores)[:k])
+        pooled_top = set(np.argsort(-pooled_scores)[:k])
+        recalls.append(len(base_top & pooled_top) / k)
+        top1_matches.append(base_scores.argmax() == pooled_scores.argmax())
+
+    base_vectors = sum(len(page) for page in page_embeddings)
+    pooled_vectors = sum(len(page) for page in pooled_pages)
+    return {
+        "pool_factor": pool_factor,
+        f"recall@{k}": float(np.mean(recalls)),
+        "top1_agreement": float(np.mean(top1_matches)),
+        "vectors": pooled_vectors,
+        "compression": base_vectors / max(pooled_vectors, 1),
+    }
+
+
+if __name__ == "__main__":
+    from PIL import Image
+    from models.embedder import ColQwen2Embedder
+
+    parser = argparse.ArgumentParser(description="评估页面多向量池化对检索质量的影响")
+    parser.add_argument("--images", required=True, help="页面图片文件夹")
+    parser.add_argument("--questions", default="data.csv", help="包含question列的CSV文件")
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--pool-factors", default="2,3,4", help="逗号分隔的池化倍数")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    embedder = ColQwen2Embedder()
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [row["question"] for row in csv.DictReader(f)][:args.num_queries]
+    paths = sorted(glob.glob(os.path.join(args.images, "*.*")))
+    pages = [np.asarray(e, dtype=np.float32)
+             for e in embedder.embed_images([Image.open(path).convert("RGB") for path in paths])]
+    queries = embedder.get_query_embeddings(questions)
+
+    print(f"页面数: {len(pages)}, 查询数: {len(queries)}, 未池化向量数: {sum(len(p) for p in pages)}")
+    for factor in [int(f) for f in args.pool_factors.split(",")]:
+        print(evaluate_pooling(queries, pages, factor, k=args.k))
@@ -0,0 +1,83 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from config.settings import QUERY_CACHE_SIZE
+
+
+def normalize_query(query):
+    """查询文本归一化：Unicode NFKC + 合并空白，不改变大小写（ColQwen2区分大小写）"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip()
+
+
+class QueryEmbeddingCache:
+    """查询向量的LRU缓存（单例模式，线程安全）
+
+    以 (模型名称, 归一化后的查询文本) 为键，ColQwen2与ColBERT共用同一个缓存，
+    重复或仅空白不同的查询不再重新编码。
+    """
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(QueryEmbeddingCache, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE):
+        if not self._initialized:
+            self.max_size = max_size
+            self._entries = OrderedDict()
+            self._lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self._initialized = True
+
+    def get_or_compute(self, model_name, query, compute_fn):
+        """返回缓存的查询向量，未命中时调用 compute_fn(query) 计算并写入缓存
+
+        Args:
+            model_name: 模型标识（embedder.cache_namespace()），区分不同编码器及其设置
+            query: 查询文本
+            compute_fn: 单条查询的编码函数，返回 numpy 多向量
+
+        Returns:
+            numpy.ndarray: 只读的查询多向量
+        """
+        key = (model_name, normalize_query(query))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+
+        embedding = compute_fn(query)
+        # 缓存中的数组被多个请求共享，禁止原地修改
+        embedding.flags.writeable = False
+
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[key] = embedding
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return embedding
+
+    def stats(self):
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
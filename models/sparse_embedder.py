@@ -0,0 +1,46 @@
+from qdrant_client import models as qdrant_models
+
+from config.settings import MODEL_CACHE_DIR, SPARSE_MODEL_NAME, HYBRID_TEXT_SEARCH
+
+
+class SparseTextEmbedder:
+    """BM25稀疏向量编码器（单例模式）
+
+    使用fastembed的SparseTextEmbedding，只做分词和词频统计，不需要GPU。
+    文档端只包含词频部分，IDF由Qdrant在检索时按集合统计（稀疏向量配置 modifier=IDF）。
+    """
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(SparseTextEmbedder, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, model_name=SPARSE_MODEL_NAME, model_cache_dir=MODEL_CACHE_DIR):
+        if not self._initialized:
+            from fastembed import SparseTextEmbedding
+            print("正在加载BM25稀疏模型...")
+            self.model_name = model_name
+            self.embedding_model = SparseTextEmbedding(model_name, cache_dir=model_cache_dir)
+            self._initialized = True
+            print(f"✅ 稀疏模型 {model_name} 加载完成")
+
+    @staticmethod
+    def _to_sparse_vector(embedding):
+        return qdrant_models.SparseVector(indices=embedding.indices.tolist(), values=embedding.values.tolist())
+
+    def get_text_embeddings(self, texts):
+        """文本块的稀疏向量列表"""
+        return [self._to_sparse_vector(embedding) for embedding in self.embedding_model.embed(list(texts))]
+
+    def get_query_embedding(self, query):
+        """查询的稀疏向量"""
+        return self._to_sparse_vector(next(iter(self.embedding_model.query_embed(query))))
+
+
+def sparse_embed_texts(texts):
+    """入库时为文本块生成稀疏向量，未启用混合检索时返回与texts等长的None列表"""
+    if not HYBRID_TEXT_SEARCH:
+        return [None] * len(texts)
+    return SparseTextEmbedder().get_text_embeddings(texts)
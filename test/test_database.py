@@ -0,0 +1,74 @@
+import pytest
+from qdrant_client.http import models as qdrant_models
+
+import models.database as database
+from models.database import QdrantManager
+
+
+@pytest.fixture
+def per_document_db(monkeypatch, tmp_path):
+    """内存模式、每文档一个集合的QdrantManager（单例按路径区分，每个测试使用独立路径）"""
+    monkeypatch.setattr(database, "QDRANT_MODE", "memory")
+    monkeypatch.setattr(database, "COLLECTION_LAYOUT", "per_document")
+    db = QdrantManager(str(tmp_path / "qdrant"), "image_collection")
+    yield db
+    db.close()
+
+
+def test_search_missing_collection_returns_empty(per_document_db):
+    query = [[1.0] + [0.0] * (database.VECTOR_SIZE - 1)]
+
+    result = per_document_db.search("unknown_doc", query, limit=3, score_threshold=None)
+
+    assert isinstance(result, qdrant_models.QueryResponse)
+    assert result.points == []
+    assert per_document_db.count_points("unknown_doc") == 0
+    # 只读路径不创建集合
+    assert not per_document_db.client.collection_exists("image_collection_unknown_doc")
+
+
+def test_delete_missing_collection(per_document_db):
+    per_document_db.delete_by_filter("unknown_doc", "image_collection")
+
+    assert "image_collection_unknown_doc" not in per_document_db._named_vectors
+
+
+def test_search_filters_by_doc_and_modality(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "QDRANT_MODE", "memory")
+    monkeypatch.setattr(database, "COLLECTION_LAYOUT", "shared")
+    db = QdrantManager(str(tmp_path / "qdrant"), "image_collection")
+    try:
+        dim = database.VECTOR_SIZE
+        vector = [[1.0] + [0.0] * (dim - 1), [0.0, 1.0] + [0.0] * (dim - 2)]
+        points = [
+            db.make_point(1, vector, {"doc_id": "doc_a", "modality": "image", "page_num": 1}),
+            db.make_point(2, vector, {"doc_id": "doc_a", "modality": "merged", "page_num": "1_2"}),
+            db.make_point(3, vector, {"doc_id": "doc_b", "modality": "image", "page_num": 1}),
+        ]
+        assert db.save_points(points)
+
+        result = db.search("doc_a", vector, limit=5, score_threshold=None, modality="image")
+
+        assert [point.id for point in result.points] == [1]
+        assert db.count_points("doc_a") == 2
+        assert db.count_points("doc_a", "merged") == 1
+    finally:
+        db.close()
+
+
+def test_local_modes_skip_quantization(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "QDRANT_MODE", "memory")
+    monkeypatch.setattr(database, "COLLECTION_LAYOUT", "shared")
+    db = QdrantManager(str(tmp_path / "qdrant"), "text_collection")
+    try:
+        updates = []
+        monkeypatch.setattr(db.client, "update_collection", lambda **kwargs: updates.append(kwargs))
+
+        # 再次确认已有集合时不应尝试迁移量化配置
+        db._ensure_collection_exists("text_collection")
+
+        assert updates == []
+        assert db._search_params() is None
+        assert db.client.get_collection("text_collection").config.quantization_config is None
+    finally:
+        db.close()
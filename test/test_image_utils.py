@@ -0,0 +1,49 @@
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils.image_utils import classify_page, downscale_to_max_pixels
+
+PAGE_SIZE = (1224, 1584)  # 144 DPI 渲染的Letter页面
+
+
+def _text_page(background=255):
+    """黑字密排的文字页（抗锯齿字体，约 9pt）"""
+    rng = random.Random(0)
+    page = Image.new("RGB", PAGE_SIZE, (background,) * 3)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=15)
+    for y in range(80, PAGE_SIZE[1] - 80, 19):
+        line = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz      ") for _ in range(130))
+        draw.text((80, y), line, fill=(15, 15, 15), font=font)
+    return page
+
+
+def _photo(size):
+    """大块平滑明暗变化的灰度“照片”"""
+    return Image.effect_noise((max(1, size[0] // 100), max(1, size[1] // 100)), 80) \
+        .resize(size, Image.BICUBIC).convert("RGB")
+
+
+def test_dense_text_page_is_text():
+    assert classify_page(_text_page()) == "text"
+    # 扫描件常见的灰色底
+    assert classify_page(_text_page(background=205)) == "text"
+
+
+def test_large_figure_is_figure():
+    assert classify_page(_photo(PAGE_SIZE)) == "figure"
+    page = _text_page()
+    page.paste(_photo((PAGE_SIZE[0], 800)), (0, 700))
+    assert classify_page(page) == "figure"
+
+
+def test_colorful_page_is_figure():
+    assert classify_page(Image.new("RGB", PAGE_SIZE, (30, 160, 60))) == "figure"
+
+
+def test_downscale_to_max_pixels():
+    image = Image.new("RGB", (2000, 1000))
+    assert downscale_to_max_pixels(image, 4_000_000) is image
+    width, height = downscale_to_max_pixels(image, 500_000).size
+    assert width * height <= 500_000 and abs(width / height - 2) < 0.01
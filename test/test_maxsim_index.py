@@ -0,0 +1,56 @@
+import numpy as np
+from qdrant_client.http import models as qdrant_models
+
+from models.maxsim_index import MaxSimIndex
+
+DIM = 8
+
+
+def _multivector(rng, num_tokens):
+    vectors = rng.standard_normal((num_tokens, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _build_index(tmp_path, chunk_tokens=65536):
+    rng = np.random.default_rng(0)
+    index = MaxSimIndex(str(tmp_path), "image", dim=DIM, chunk_tokens=chunk_tokens)
+    pages = [_multivector(rng, num_tokens) for num_tokens in (5, 3, 7, 4)]
+    ids = [f"00000000-0000-0000-0000-00000000000{i}" for i in range(len(pages))]
+    payloads = [{"doc_id": "doc", "page_num": i + 1, "image_path": f"page_{i + 1}.png"} for i in range(len(pages))]
+    index.add(ids[:2], pages[:2], payloads[:2])
+    index.add(ids[2:], pages[2:], payloads[2:])
+    return index, pages, ids
+
+
+def test_search_returns_query_response(tmp_path):
+    index, pages, ids = _build_index(tmp_path)
+
+    result = index.search(pages[2][:3], limit=2, payload_fields=["page_num"])
+
+    assert isinstance(result, qdrant_models.QueryResponse)
+    assert len(result.points) == 2
+    assert str(result.points[0].id) == ids[2]
+    assert result.points[0].payload == {"page_num": 3}
+    assert result.points[0].score >= result.points[1].score
+
+
+def test_chunked_scores_match_single_pass(tmp_path):
+    index, pages, _ = _build_index(tmp_path)
+    chunked = MaxSimIndex(str(tmp_path), "image", dim=DIM, chunk_tokens=6)
+    query = _multivector(np.random.default_rng(1), 4)
+
+    expected = [np.max(query @ page.astype(np.float16).astype(np.float32).T, axis=1).sum() for page in pages]
+
+    np.testing.assert_allclose(index.scores(query), expected, rtol=1e-5)
+    np.testing.assert_allclose(chunked.scores(query), expected, rtol=1e-5)
+
+
+def test_score_threshold_and_empty_index(tmp_path):
+    index, pages, ids = _build_index(tmp_path)
+
+    result = index.search(pages[1], limit=4, score_threshold=0.99)
+    assert [str(point.id) for point in result.points] == [ids[1]]
+
+    empty = MaxSimIndex(str(tmp_path), "text", dim=DIM)
+    assert len(empty) == 0
+    assert empty.search(pages[0]).points == []
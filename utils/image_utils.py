@@ -0,0 +1,84 @@
+import math
+
+from PIL import Image, ImageFilter
+
+from config.settings import PAGE_PROFILE_MODE, PAGE_PROFILES, PAGE_CLASSIFY_SIZE, PAGE_FIGURE_FILL_RATIO
+
+# 图片格式与文件扩展名、MIME类型的对应关系
+IMAGE_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg", "PNG": ".png"}
+IMAGE_MIME_TYPES = {".webp": "image/webp", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+
+def classify_page(image):
+    """粗略判断页面是文字密集还是图表密集
+
+    用最近邻采样缩小页面（不做平均，密集的小字不会被抹成中间调），以出现最多的灰度为底色，
+    标出与底色相差较大的像素。文字笔画很细，经最小值滤波腐蚀后基本消失，
+    图表、照片的大块填充区域则会保留；保留面积比例超过 PAGE_FIGURE_FILL_RATIO
+    或平均饱和度较高时判为图表页。
+
+    Returns:
+        str: "text" 或 "figure"
+    """
+    scale = min(1.0, PAGE_CLASSIFY_SIZE / max(image.width, image.height))
+    sample = image.convert("RGB").resize(
+        (max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.NEAREST
+    )
+    gray = sample.convert("L")
+    gray_hist = gray.histogram()
+    background = max(range(256), key=lambda value: gray_hist[value])
+    mask = gray.point(lambda value: 255 if abs(value - background) > 48 else 0)
+    fill_ratio = mask.filter(ImageFilter.MinFilter(5)).histogram()[255] / max(gray.width * gray.height, 1)
+    sat_hist = sample.convert("HSV").getchannel("S").histogram()
+    mean_saturation = sum(value * count for value, count in enumerate(sat_hist)) / max(sum(sat_hist), 1)
+    return "figure" if fill_ratio > PAGE_FIGURE_FILL_RATIO or mean_saturation > 40 else "text"
+
+
+def select_page_profile(image):
+    """按 PAGE_PROFILE_MODE 为页面选择保存策略，返回 (策略名, 策略配置)"""
+    name = classify_page(image) if PAGE_PROFILE_MODE == "auto" else PAGE_PROFILE_MODE
+    return name, PAGE_PROFILES[name]
+
+
+def downscale_to_max_pixels(image, max_pixels):
+    """等比缩小图片使总像素不超过max_pixels（不放大）"""
+    if not max_pixels or image.width * image.height <= max_pixels:
+        return image
+    scale = math.sqrt(max_pixels / (image.width * image.height))
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def page_image_path(path_stem, profile):
+    """按保存策略的图片格式生成完整文件路径"""
+    return path_stem + IMAGE_EXTENSIONS[profile["format"].upper()]
+
+
+def save_page_image(image, path_stem, profile):
+    """按保存策略编码图片
+
+    Args:
+        image: PIL图片
+        path_stem: 不含扩展名的保存路径
+        profile: PAGE_PROFILES 中的一项
+
+    Returns:
+        str: 实际保存的文件路径（扩展名由格式决定）
+    """
+    image_format = profile["format"].upper()
+    path = page_image_path(path_stem, profile)
+    if image_format == "PNG":
+        image.save(path, image_format, optimize=False)
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(path, image_format, quality=profile.get("quality", 85))
+    return path
+
+
+def image_mime_type(path):
+    """根据扩展名返回图片MIME类型"""
+    for extension, mime_type in IMAGE_MIME_TYPES.items():
+        if path.lower().endswith(extension):
+            return mime_type
+    return "image/png"
@@ -0,0 +1,54 @@
+import threading
+import concurrent.futures
+
+from config.settings import IMAGE_WRITER_THREADS, IMAGE_WRITER_MAX_PENDING
+from utils.image_utils import save_page_image, page_image_path
+
+
+class AsyncImageWriter:
+    """后台编码并保存页面图片
+
+    渲染得到的图片直接在内存中交给向量化阶段，编码写盘由后台线程完成，
+    不再占用入库的关键路径。排队图片数有上限，避免写盘跟不上时内存无限增长。
+    """
+
+    def __init__(self, max_workers=IMAGE_WRITER_THREADS, max_pending=IMAGE_WRITER_MAX_PENDING):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = []
+
+    def _release(self, _future):
+        self._slots.release()
+
+    def submit(self, image, path_stem, profile):
+        """提交写盘任务，立即返回最终的文件路径
+
+        Args:
+            image: PIL图片（提交后不应再修改）
+            path_stem: 不含扩展名的保存路径
+            profile: PAGE_PROFILES 中的一项
+        """
+        self._slots.acquire()
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="image-writer"
+                )
+            future = self._executor.submit(save_page_image, image, path_stem, profile)
+            self._futures.append(future)
+        future.add_done_callback(self._release)
+        return page_image_path(path_stem, profile)
+
+    def flush(self):
+        """等待所有写盘任务完成并释放线程，任一任务失败时抛出其异常"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+            executor, self._executor = self._executor, None
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
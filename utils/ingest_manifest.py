@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+
+
+class IngestManifest:
+    """入库清单：记录某个文档各模态已成功写入数据库的条目序号
+
+    清单保存在文档输出目录下，每次批次写库成功后立即落盘（临时文件+重命名）。
+    入库中途失败后重新处理同一文档时，已完成的批次直接跳过，从上次提交的位置继续。
+    清单同时记录写入的目标库（Qdrant模式、存储位置、集合布局和集合名），目标库变化后清单作废。
+    """
+
+    def __init__(self, path, doc_hash, target=None):
+        """
+        Args:
+            path: 清单文件路径
+            doc_hash: 文档内容哈希，与已有清单不一致时清单作废
+            target: 写入目标库的标识，与已有清单不一致时清单作废
+        """
+        self.path = path
+        self.doc_hash = doc_hash
+        self.target = target
+        self._lock = threading.Lock()
+        self.completed = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取入库清单时出错，将重新入库: {str(e)}")
+            return
+        if data.get("doc_hash") != self.doc_hash:
+            return
+        if data.get("target") != self.target:
+            print(f"入库清单对应的数据库已变化（{data.get('target')} -> {self.target}），将重新入库")
+            return
+        self.completed = {
+            modality: set(indices) for modality, indices in data.get("completed", {}).items()
+        }
+
+    def _save(self):
+        data = {
+            "doc_hash": self.doc_hash,
+            "target": self.target,
+            "completed": {modality: sorted(indices) for modality, indices in self.completed.items()},
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, modality, index):
+        with self._lock:
+            return index in self.completed.get(modality, ())
+
+    def done_count(self, modality):
+        with self._lock:
+            return len(self.completed.get(modality, ()))
+
+    def mark_done(self, modality, indices):
+        """记录一个已提交的批次"""
+        with self._lock:
+            self.completed.setdefault(modality, set()).update(indices)
+            self._save()
+
+    def reset(self, modality):
+        """作废某个模态的全部记录（如数据库中的数据点已不存在）"""
+        with self._lock:
+            if self.completed.pop(modality, None) is not None:
+                self._save()
@@ -0,0 +1,79 @@
+import threading
+import time
+
+
+class LazyComponent:
+    """首次使用时才构造的组件代理
+
+    对代理的属性访问会在第一次时调用 factory 构造真实对象（线程安全，只构造一次），
+    之后直接转发，调用方可以像使用真实对象一样使用代理。
+    """
+
+    def __init__(self, name, factory):
+        """
+        Args:
+            name: 组件名称，用于启动耗时报告
+            factory: 无参构造函数
+        """
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_time = None  # 构造耗时（秒），未加载时为None
+        self.loaded_by = None  # "warmup" 或 "on-demand"
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def get(self, loaded_by="on-demand"):
+        """返回真实对象，必要时构造"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start_time = time.time()
+                    print(f"正在初始化 {self._name}...")
+                    instance = self._factory()
+                    self.load_time = time.time() - start_time
+                    self.loaded_by = loaded_by
+                    self._instance = instance
+                    print(f"✅ {self._name} 初始化完成，用时 {self.load_time:.2f} 秒")
+        return self._instance
+
+    def __getattr__(self, item):
+        # 只有代理自身没有的属性才会走到这里
+        return getattr(self.get(), item)
+
+    def __repr__(self):
+        state = f"{self.load_time:.2f}s" if self.loaded else "未加载"
+        return f"<LazyComponent {self._name} ({state})>"
+
+
+def start_warmup(components):
+    """在后台线程中按顺序预加载组件，已加载的组件直接跳过
+
+    Returns:
+        threading.Thread: 预热线程
+    """
+    def warmup():
+        for component in components:
+            try:
+                component.get(loaded_by="warmup")
+            except Exception as e:
+                print(f"❌ 预加载 {component._name} 失败: {str(e)}")
+        print(startup_report(components))
+
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report(components):
+    """各组件的初始化耗时报告"""
+    lines = ["组件初始化耗时:"]
+    for component in components:
+        if component.loaded:
+            lines.append(f"  {component._name}: {component.load_time:.2f}s ({component.loaded_by})")
+        else:
+            lines.append(f"  {component._name}: 未加载")
+    return "\n".join(lines)
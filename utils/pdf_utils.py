@@ -0,0 +1,58 @@
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from config.settings import PDF_PAGE_WINDOW, PDF_CONVERT_THREADS
+
+
+def get_pdf_page_count(pdf_path):
+    """获取PDF的总页数（只读取元信息，不进行渲染）"""
+    info = pdfinfo_from_path(pdf_path)
+    return int(info["Pages"])
+
+
+def iter_pdf_pages(pdf_path, window_size=PDF_PAGE_WINDOW, thread_count=PDF_CONVERT_THREADS, page_count=None,
+                   **convert_kwargs):
+    """按页码窗口流式渲染PDF页面
+
+    每次只调用 convert_from_path 渲染 [first_page, last_page] 范围内的页面，
+    窗口内部使用多线程转换。调用方每消费完一页，该页图片即可被释放，
+    因此峰值内存只与窗口大小有关，与PDF总页数无关。
+
+    Args:
+        pdf_path: PDF文件路径
+        window_size: 每个渲染窗口包含的页数
+        thread_count: 单个窗口内的转换线程数
+        page_count: 已知的总页数，为None时通过pdfinfo读取
+        **convert_kwargs: 透传给 convert_from_path 的其他参数（如 dpi）
+
+    Yields:
+        (page_num, PIL.Image): 页码从1开始
+    """
+    if page_count is None:
+        page_count = get_pdf_page_count(pdf_path)
+    window_size = max(1, window_size)
+
+    for first_page in range(1, page_count + 1, window_size):
+        last_page = min(first_page + window_size - 1, page_count)
+        images = convert_from_path(
+            pdf_path,
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=min(thread_count, last_page - first_page + 1),
+            **convert_kwargs
+        )
+        for offset, image in enumerate(images):
+            yield first_page + offset, image
+        # 释放当前窗口的引用，避免与下一个窗口同时驻留内存
+        del images
+
+
+def iter_batches(iterable, batch_size):
+    """将任意可迭代对象按批次切分（支持生成器，不会一次性展开）"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
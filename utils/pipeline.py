@@ -0,0 +1,144 @@
+import queue
+import threading
+
+from config.settings import PIPELINE_QUEUE_SIZE
+
+# 队列结束标记
+_STOP = object()
+
+
+class Pipeline:
+    """多阶段流水线：阶段之间用有界队列连接，每个阶段一个工作线程
+
+    数据源在独立线程中被消费，每个阶段从上游队列取数据、处理后放入下游队列。
+    有界队列保证快的阶段不会无限堆积数据（背压），
+    整体耗时趋近于最慢阶段的耗时，而不是所有阶段耗时之和。
+
+    用法:
+        Pipeline("image", pages) \\
+            .add_stage("embed", embed_batch, batch_size=4) \\
+            .add_stage("upsert", save_points) \\
+            .run()
+    """
+
+    def __init__(self, name, source, queue_size=PIPELINE_QUEUE_SIZE):
+        """
+        Args:
+            name: 流水线名称，用于日志和线程命名
+            source: 数据源，任意可迭代对象（通常是生成器）
+            queue_size: 阶段之间队列的最大长度
+        """
+        self.name = name
+        self.source = source
+        self.queue_size = queue_size
+        self.stages = []
+        self._abort = threading.Event()
+        self._errors = []
+
+    def add_stage(self, name, func, batch_size=1):
+        """添加一个处理阶段
+
+        Args:
+            name: 阶段名称
+            func: 处理函数。batch_size为1时接收单个元素，否则接收元素列表；
+                返回值为None时不向下游输出，否则应为可迭代对象，其中每个元素放入下游队列
+            batch_size: 每次最多取出的元素数。队列暂时为空时会提前提交不足一批的数据，
+                避免下游空等
+        """
+        self.stages.append((name, func, max(1, batch_size)))
+        return self
+
+    def _put(self, q, item):
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _fail(self, stage_name, e):
+        print(f"❌ 流水线 {self.name} 的阶段 {stage_name} 出错: {str(e)}")
+        self._errors.append(e)
+        self._abort.set()
+
+    def _run_source(self, out_q):
+        try:
+            for item in self.source:
+                if not self._put(out_q, item):
+                    return
+        except Exception as e:
+            self._fail("source", e)
+        finally:
+            self._put(out_q, _STOP)
+
+    def _run_stage(self, name, func, batch_size, in_q, out_q):
+        def emit(outputs):
+            if outputs is None or out_q is None:
+                return
+            for output in outputs:
+                self._put(out_q, output)
+
+        try:
+            finished = False
+            while not finished:
+                item = self._get(in_q)
+                if item is _STOP:
+                    break
+                if batch_size == 1:
+                    emit(func(item))
+                    continue
+
+                batch = [item]
+                while len(batch) < batch_size:
+                    try:
+                        item = in_q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        finished = True
+                        break
+                    batch.append(item)
+                emit(func(batch))
+        except Exception as e:
+            self._fail(name, e)
+        finally:
+            if out_q is not None:
+                self._put(out_q, _STOP)
+
+    def run(self):
+        """启动所有阶段并阻塞直到数据全部流过流水线
+
+        Raises:
+            任一阶段抛出的第一个异常（其余阶段会随之停止）
+        """
+        if not self.stages:
+            raise ValueError(f"流水线 {self.name} 没有任何处理阶段")
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(
+            target=self._run_source, args=(queues[0],),
+            name=f"{self.name}-source", daemon=True
+        )]
+        for index, (name, func, batch_size) in enumerate(self.stages):
+            out_q = queues[index + 1] if index + 1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(name, func, batch_size, queues[index], out_q),
+                name=f"{self.name}-{name}", daemon=True
+            ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]